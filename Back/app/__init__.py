@@ -4,6 +4,7 @@ from flask import Flask
 from flasgger import Swagger
 from .config import Config
 from .routes import api_blueprint
+from .reference_data import reference_data
 from flask_pymongo import PyMongo
 from flask_cors import CORS
 
@@ -26,4 +27,7 @@ def create_app():
     # Register API routes
     app.register_blueprint(api_blueprint)
 
+    # Product names are needed by every /api/products/<id>/pairs response; load them before the first one
+    reference_data.prefetch('product_names')
+
     return app
@@ -1,13 +1,27 @@
 import pyodbc
 import pandas as pd
 import numpy as np
-import itertools
-from collections import defaultdict
 import networkx as nx
+from scipy import sparse
 from node2vec import Node2Vec
 from sklearn.manifold import TSNE
+import joblib
+import datetime
 import json
 import os
+import threading
+
+from app.category_assignment import aisle_distance_matrix, assign_categories
+from app.copurchase_state import update_copurchase_state
+from app.layout_analytics import door_distance_field, reach_distance_field
+from app.layout_codec import JSON_ENCODING, decode_grid, encode_grid
+
+# Bump when the artifact layout changes; older artifacts are then rejected
+CATEGORY_ARTIFACT_VERSION = 2
+category_artifact_path = os.path.join('app', 'models', 'category_embeddings.pkl')
+
+# Aisle cells considered per category, so distances stay small on very large grids
+CANDIDATE_AISLES_PER_CATEGORY = 4
 
 
 def get_db_connection():
@@ -20,67 +34,163 @@ def get_db_connection():
     return conn
 
 
-def recommend_category_placement(store_data):
-    grid = store_data["grid"]
-
-    # Connect to SQL Server
-    conn = get_db_connection()
-    query = """
-    SELECT 
-        F.CustomerID,
-        F.ProductID,
-        D.BK_Category
-    FROM Fact_SalesPerformance F
-    JOIN DimProduct P ON F.ProductID = P.PK_Product
-    JOIN DimCategory D ON F.CategoryID = D.PK_Category
-    WHERE F.CustomerID IS NOT NULL
-      AND F.ProductID IS NOT NULL
-      AND F.SalesTransactions_Amount IS NOT NULL
+def category_cooccurrence(df):
+    """
+    Count, for every pair of categories, how many customers bought from both.
+
+    Builds the binary customer x category incidence matrix C and returns the
+    sorted category names with the sparse product C^T C, whose off-diagonal
+    entries are the pair counts (the diagonal counts customers per category).
     """
-    df = pd.read_sql(query, conn)
+    df = df.dropna(subset=["CustomerID", "BK_Category"])
+    customer_codes, customers = pd.factorize(df["CustomerID"])
+    category_codes, categories = pd.factorize(df["BK_Category"], sort=True)
+
+    incidence = sparse.csr_matrix(
+        (np.ones(len(df), dtype=np.int32), (customer_codes, category_codes)),
+        shape=(len(customers), len(categories))
+    )
+    incidence.sum_duplicates()
+    incidence.data[:] = 1
+
+    return list(categories), (incidence.T @ incidence).tocsr()
 
-    # Build co-purchase graph
-    category_pairs = defaultdict(int)
-    grouped = df.groupby("CustomerID")["BK_Category"].apply(set)
-    for cats in grouped:
-        for c1, c2 in itertools.combinations(sorted(cats), 2):
-            category_pairs[(c1, c2)] += 1
+
+def build_category_graph(categories, cooccurrence):
+    # Build co-purchase graph straight from the upper triangle of C^T C
+    pairs = sparse.triu(sparse.csr_matrix(cooccurrence), k=1).tocoo()
 
     G = nx.Graph()
-    for (c1, c2), weight in category_pairs.items():
-        G.add_edge(c1, c2, weight=weight)
+    G.add_weighted_edges_from(
+        (categories[i], categories[j], int(w)) for i, j, w in zip(pairs.row, pairs.col, pairs.data)
+    )
+    return G
+
+
+def build_category_artifact(path=category_artifact_path):
+    """
+    Offline job: fold the latest sales into the co-purchase state, compute
+    category embeddings and their 2-D t-SNE coordinates from it and persist
+    them for the request path.
+    """
+    state, _ = update_copurchase_state()
+    G = build_category_graph(state.categories, state.category_counts)
 
     # Embedding
     category2vec = Node2Vec(G, dimensions=16, walk_length=10, num_walks=50, workers=2)
     category_model = category2vec.fit(window=3, min_count=1)
-    category_embeddings = {node: category_model.wv[node] for node in G.nodes}
+    category_names = list(G.nodes)
+    embeddings = np.array([category_model.wv[node] for node in category_names])
 
     # Dimensionality reduction
-    X = np.array(list(category_embeddings.values()))
-    category_names = list(category_embeddings.keys())
     tsne = TSNE(n_components=2, perplexity=5, random_state=42)
-    X_2d = tsne.fit_transform(X)
-    category_coords = dict(zip(category_names, X_2d))
+    coords = tsne.fit_transform(embeddings)
+
+    # Placement order used when assigning categories to aisle cells
+    order = sorted(range(len(category_names)), key=lambda i: (coords[i][1], coords[i][0]))
 
-    # Find Aisle cells
-    aisle_cells = [
-        (i, j)
-        for i, row in enumerate(grid)
-        for j, cell in enumerate(row)
-        if cell.get("type") == "Aisle"
-    ]
+    # Co-purchase weights in the same order as category_names
+    index = [state.category_index[name] for name in category_names]
+    cooccurrence = state.category_counts[np.ix_(index, index)].copy()
+    np.fill_diagonal(cooccurrence, 0)
+
+    artifact = {
+        'version': CATEGORY_ARTIFACT_VERSION,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'categories': category_names,
+        'embeddings': embeddings,
+        'coords': coords,
+        'ordered_categories': [category_names[i] for i in order],
+        'cooccurrence': cooccurrence
+    }
+
+    # Write next to the target and swap it in, so readers never see half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    joblib.dump(artifact, tmp_path)
+    os.replace(tmp_path, path)
+    return artifact
+
+
+_artifact_cache = {}
+_artifact_lock = threading.Lock()
+
+
+def load_category_artifact(path=category_artifact_path):
+    """
+    Load the persisted category artifact, reusing the in-memory copy until the
+    file on disk is replaced by a newer build.
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        raise FileNotFoundError(
+            f"Category embeddings not found at {path}. Build them with: python -m app.aisles_recom"
+        )
+
+    with _artifact_lock:
+        cached = _artifact_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            artifact = joblib.load(path)
+            if artifact.get('version') != CATEGORY_ARTIFACT_VERSION:
+                raise ValueError(
+                    f"Category embeddings at {path} are version {artifact.get('version')}, "
+                    f"expected {CATEGORY_ARTIFACT_VERSION}. Rebuild them with: python -m app.aisles_recom"
+                )
+            cached = (mtime, artifact)
+            _artifact_cache[path] = cached
+        return cached[1]
+
+
+def candidate_aisles(grid, ys, xs, n_categories):
+    """
+    Indices (ascending, so in (y, x) order) of a bounded pool of aisle cells:
+    the first `n_categories` cells, where categories start, topped up with the
+    aisles nearest the doors to CANDIDATE_AISLES_PER_CATEGORY per category.
+    """
+    pool_size = min(ys.size, CANDIDATE_AISLES_PER_CATEGORY * n_categories)
+    reach = reach_distance_field(door_distance_field(grid))[ys, xs].astype(np.int64)
+    reach[reach < 0] = np.iinfo(np.int64).max
+
+    chosen = np.zeros(ys.size, dtype=bool)
+    chosen[:n_categories] = True
+    by_door = np.argsort(reach, kind='stable')
+    chosen[by_door[~chosen[by_door]][:pool_size - n_categories]] = True
+    return np.flatnonzero(chosen)
+
+
+def recommend_category_placement(store_data, encoding=JSON_ENCODING, time_budget=1.0, seed=None):
+    """
+    Place categories on the aisle cells so that categories often bought
+    together sit a short walk apart. The t-SNE order on aisle cells sorted by
+    (y, x) is the starting point; a local search then improves it for up to
+    `time_budget` seconds, over a pool of a few candidate aisles per category
+    (see candidate_aisles) rather than every aisle of the store.
+    """
+    grid = decode_grid(store_data["grid"])
+    artifact = load_category_artifact()
 
-    aisle_cells = sorted(aisle_cells, key=lambda idx: (grid[idx[0]][idx[1]]["y"], grid[idx[0]][idx[1]]["x"]))
+    # Find Aisle cells, ordered by (y, x)
+    ys, xs = np.nonzero(grid.mask("Aisle"))
+    if not ys.size:
+        return encode_grid(grid, encoding)
 
-    # Assign categories to aisle cells
-    ordered_categories = sorted(category_coords.items(), key=lambda x: (x[1][1], x[1][0]))
-    assigned_categories = [cat for cat, _ in ordered_categories[:len(aisle_cells)]]
+    # Categories that fit, starting on the first aisle cells in t-SNE order
+    index = {name: i for i, name in enumerate(artifact['categories'])}
+    placed = [index[name] for name in artifact['ordered_categories'][:ys.size]]
+    weights = artifact['cooccurrence'][np.ix_(placed, placed)]
 
-    # Modify grid in-place
-    for (i, j), category in zip(aisle_cells, assigned_categories):
-        grid[i][j]["type"] = f"Aisle - {category}"
+    pool = candidate_aisles(grid, ys, xs, len(placed))
+    ys, xs = ys[pool], xs[pool]
+    distances = aisle_distance_matrix(grid, (ys, xs))
+    assignment, _ = assign_categories(weights, distances, time_budget=time_budget, seed=seed)
 
-    return grid
+    for category, cell in zip(placed, assignment):
+        grid.set_type(int(xs[cell]), int(ys[cell]), f"Aisle - {artifact['categories'][category]}")
 
+    return encode_grid(grid, encoding)
 
 
+if __name__ == '__main__':
+    result = build_category_artifact()
+    print(f"✅ Category embeddings for {len(result['categories'])} categories saved to {category_artifact_path}")
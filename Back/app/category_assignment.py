@@ -0,0 +1,170 @@
+# app/category_assignment.py
+
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+from app.layout_analytics import WALKABLE_TYPES
+
+# Caps the (sources x walkable cells) block handed to csgraph at once
+DISTANCE_BLOCK_CELLS = 2 ** 24
+
+
+def aisle_distance_matrix(grid, cells):
+    """
+    Walking distance between every pair of the aisle `cells` ((ys, xs) arrays):
+    shortest walkway path between one of each cell's walkable sides, plus the
+    step into and out of the aisle. Aisles are never walked through. Pairs
+    with no path get rows * cols, longer than any real walk.
+    """
+    ys, xs = (np.asarray(a, dtype=np.int64) for a in cells)
+    walkable = grid.mask(*WALKABLE_TYPES)
+    rows, cols = walkable.shape
+    n = ys.size
+    unreachable = float(rows * cols)
+    distances = np.full((n, n), unreachable)
+    np.fill_diagonal(distances, 0.0)
+
+    # Node ids for walkable cells, and the walkway graph between them
+    node = np.full(walkable.shape, -1, dtype=np.int64)
+    n_walkable = int(walkable.sum())
+    node[walkable] = np.arange(n_walkable)
+    right = walkable[:, :-1] & walkable[:, 1:]
+    down = walkable[:-1, :] & walkable[1:, :]
+    src = np.concatenate([node[:, :-1][right], node[:-1, :][down]])
+    dst = np.concatenate([node[:, 1:][right], node[1:, :][down]])
+    graph = sparse.csr_matrix((np.ones(src.size), (src, dst)), shape=(n_walkable, n_walkable))
+    graph = (graph + graph.T).tocsr()
+
+    # (aisle, side node) pairs, grouped by aisle
+    owners, sides = [], []
+    for dy, dx in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+        ny, nx = ys + dy, xs + dx
+        inside = (ny >= 0) & (ny < rows) & (nx >= 0) & (nx < cols)
+        aisle_ids = np.nonzero(inside)[0]
+        side_nodes = node[ny[inside], nx[inside]]
+        keep = side_nodes >= 0
+        owners.append(aisle_ids[keep])
+        sides.append(side_nodes[keep])
+    owners, sides = np.concatenate(owners), np.concatenate(sides)
+    if not owners.size:
+        return distances
+    order = np.argsort(owners, kind='stable')
+    owners, sides = owners[order], sides[order]
+    reached, starts = np.unique(owners, return_index=True)
+
+    # One extra source node per aisle, with a step into each of its sides and no way back in,
+    # so a single search per aisle covers all its sides and no path walks through an aisle
+    entries = sparse.csr_matrix(
+        (np.ones(owners.size), (np.searchsorted(reached, owners), sides)), shape=(reached.size, n_walkable)
+    )
+    graph = sparse.bmat([[graph, None], [entries, sparse.csr_matrix((reached.size, reached.size))]], format='csr')
+
+    # Distance from each aisle to the closest side of every aisle, then the step out into it
+    between = np.empty((reached.size, reached.size))
+    block = max(1, DISTANCE_BLOCK_CELLS // graph.shape[0])
+    for start in range(0, reached.size, block):
+        sources = n_walkable + np.arange(start, min(start + block, reached.size))
+        chunk = csgraph.shortest_path(graph, directed=True, unweighted=True, indices=sources)
+        between[start:start + block] = np.minimum.reduceat(chunk[:, sides], starts, axis=1) + 1
+    between[~np.isfinite(between)] = unreachable
+    np.fill_diagonal(between, 0.0)
+    distances[np.ix_(reached, reached)] = between
+    return distances
+
+
+def assignment_cost(weights, distances, assignment):
+    """
+    Sum over category pairs of co-purchase weight times the walking distance
+    between their aisles. `assignment[i]` is the location of category i.
+    """
+    placed = distances[np.ix_(assignment, assignment)]
+    return float((weights * placed).sum() / 2)
+
+
+def assign_categories(weights, distances, initial=None, time_budget=1.0, seed=None):
+    """
+    Anytime quadratic-assignment local search: place n categories (symmetric
+    co-purchase `weights`, n x n) on m >= n locations (symmetric `distances`,
+    m x m) so that frequently co-bought categories end up close together.
+
+    Starts from `initial` (default: category i at location i) and runs
+    best-improvement swap passes, evaluating every swap for a category in one
+    vectorised step. At a local optimum the best assignment is perturbed with
+    a few random swaps and the search continues until `time_budget` seconds
+    have passed. Returns (assignment, cost) for the best assignment found.
+    """
+    if not 0 < time_budget < np.inf:
+        raise ValueError(f'time_budget must be a positive number of seconds, got {time_budget}')
+    deadline = time.perf_counter() + time_budget
+    weights = np.asarray(weights, dtype=float)
+    distances = np.asarray(distances, dtype=float)
+    n, m = weights.shape[0], distances.shape[0]
+    if n > m:
+        raise ValueError(f'{n} categories do not fit in {m} locations')
+
+    # Locations left empty hold zero-weight dummy categories n..m-1
+    assignment = np.arange(m)
+    if initial is not None:
+        initial = np.asarray(initial, dtype=np.int64)
+        free = np.setdiff1d(assignment, initial)
+        assignment = np.concatenate([initial, free])
+
+    padded = np.zeros((n, m))
+    padded[:, :n] = weights
+    np.fill_diagonal(padded, 0.0)
+    weights = padded[:, :n]
+    rng = np.random.default_rng(seed)
+
+    def placed(assignment):
+        # placed[i, k] = distance between the locations of categories i and k
+        dist = distances[np.ix_(assignment, assignment)]
+        return dist, (padded * dist[:n]).sum(axis=1)
+
+    dist, row_costs = placed(assignment)
+    cost = row_costs.sum() / 2
+    best, best_cost = assignment.copy(), cost
+
+    while n > 1 and time.perf_counter() < deadline:
+        improved = False
+        for r in rng.permutation(n):
+            if time.perf_counter() >= deadline:
+                break
+            # Cost change of swapping category r with every s at once
+            delta = dist[:, :n] @ weights[r] - row_costs[r] + 2 * padded[r] * dist[r]
+            delta[:n] += weights @ dist[r, :n] - row_costs[:n]
+            delta[r] = 0.0
+            s = int(np.argmin(delta))
+            if delta[s] >= -1e-9:
+                continue
+
+            other = padded[:, s] if s < n else 0.0
+            row_costs[:n] += (padded[:, r] - other) * (dist[:n, s] - dist[:n, r])
+            assignment[[r, s]] = assignment[[s, r]]
+            dist[[r, s]] = dist[[s, r]]
+            dist[:, [r, s]] = dist[:, [s, r]]
+            row_costs[r] = padded[r] @ dist[r]
+            if s < n:
+                row_costs[s] = padded[s] @ dist[s]
+            cost += delta[s]
+            improved = True
+
+        if improved:
+            continue
+
+        # Local optimum: keep it if best, then restart from a kicked copy of the best
+        if cost < best_cost - 1e-9:
+            best, best_cost = assignment.copy(), cost
+        assignment = best.copy()
+        for _ in range(max(2, n // 8)):
+            r, s = rng.integers(n), rng.integers(m)
+            assignment[[r, s]] = assignment[[s, r]]
+        dist, row_costs = placed(assignment)
+        cost = row_costs.sum() / 2
+
+    if cost < best_cost - 1e-9:
+        best = assignment
+    best = best[:n]
+    return best, assignment_cost(weights, distances, best)
@@ -13,3 +13,21 @@ class Config:
     MONGO_URI = os.getenv("MONGO_URI")
     SECRET_KEY = os.getenv("SECRET_KEY")
     JWT_EXPIRATION_SECONDS = 86400  # 1 day
+
+    # Process pool size for multi-start layout optimisation
+    LAYOUT_OPTIMIZER_WORKERS = int(os.getenv("LAYOUT_OPTIMIZER_WORKERS", os.cpu_count() or 1))
+    # Upper bounds on a single /api/optimize_layout request
+    MAX_LAYOUT_STARTS = int(os.getenv("MAX_LAYOUT_STARTS", 64))
+    MAX_LAYOUT_TIME_BUDGET = float(os.getenv("MAX_LAYOUT_TIME_BUDGET", 60))
+    # Upper bounds on a single /api/simulate_shoppers request
+    MAX_SIMULATED_SHOPPERS = int(os.getenv("MAX_SIMULATED_SHOPPERS", 200000))
+    MAX_BASKET_SIZE = int(os.getenv("MAX_BASKET_SIZE", 50))
+    # Each simulation target holds one distance field (rows x cols int32)
+    MAX_SIMULATION_TARGETS = int(os.getenv("MAX_SIMULATION_TARGETS", 256))
+    # Upper bound on the search time of a single /api/recommend_category_placement request
+    MAX_PLACEMENT_TIME_BUDGET = float(os.getenv("MAX_PLACEMENT_TIME_BUDGET", 10))
+    # Upper bounds on a single /api/products/<id>/pairs request
+    MAX_PRODUCT_PAIRS = int(os.getenv("MAX_PRODUCT_PAIRS", 100))
+    MAX_PAIR_CANDIDATES = int(os.getenv("MAX_PAIR_CANDIDATES", 500))
+    # Upper bound on n of a single /api/recommend_suppliers/batch request
+    MAX_SUPPLIER_RECOMMENDATIONS = int(os.getenv("MAX_SUPPLIER_RECOMMENDATIONS", 50))
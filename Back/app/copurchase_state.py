@@ -0,0 +1,173 @@
+# app/copurchase_state.py
+
+import datetime
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+import pyodbc
+from scipy import sparse
+
+COPURCHASE_STATE_VERSION = 1
+copurchase_state_path = os.path.join('app', 'models', 'copurchase_state.pkl')
+
+# Monotonically increasing key of Fact_SalesPerformance used as the watermark
+SALES_WATERMARK_COLUMN = os.getenv('SALES_WATERMARK_COLUMN', 'PK_SalesPerformance')
+
+
+def get_db_connection():
+    conn = pyodbc.connect(
+        f"DRIVER={{{os.getenv('SQL_DRIVER')}}};"
+        f"SERVER={os.getenv('SQL_SERVER')};"
+        f"DATABASE={os.getenv('SQL_DATABASE')};"
+        "Trusted_Connection=yes;"
+    )
+    return conn
+
+
+class CopurchaseState:
+    """
+    Running co-purchase aggregates over Fact_SalesPerformance:
+
+    - customer_products: customer -> set of product ids (training graph edges)
+    - customer_categories: customer -> set of category indices
+    - category_counts: K x K matrix of customers who bought from both
+      categories (the diagonal counts customers per category), i.e. C^T C
+    - watermark: largest sale key already folded in
+    """
+
+    def __init__(self):
+        self.version = COPURCHASE_STATE_VERSION
+        self.watermark = None
+        self.updated_at = None
+        self.categories = []
+        self.category_index = {}
+        self.customer_categories = {}
+        self.customer_products = {}
+        self.category_counts = np.zeros((0, 0), dtype=np.int64)
+
+    def _category_codes(self, names):
+        for name in names:
+            if name not in self.category_index:
+                self.category_index[name] = len(self.categories)
+                self.categories.append(name)
+        grow = len(self.categories) - self.category_counts.shape[0]
+        if grow > 0:
+            self.category_counts = np.pad(self.category_counts, ((0, grow), (0, grow)))
+        return [self.category_index[name] for name in names]
+
+    def apply_sales(self, df):
+        """
+        Fold new sales rows (CustomerID, ProductID, BK_Category, CatalogProduct,
+        SaleKey) into the aggregates. Only customers present in `df` are touched.
+        """
+        if df.empty:
+            return
+
+        customers = df['CustomerID'].astype(str)
+        for customer, products in df['ProductID'].astype(str).groupby(customers):
+            self.customer_products.setdefault(customer, set()).update(products)
+
+        # Categories only count for products known to DimProduct, as in the full query
+        known = df['CatalogProduct'].notna() & df['BK_Category'].notna()
+        new_categories = df.loc[known, 'BK_Category'].groupby(customers[known]).unique()
+
+        old_rows, old_cols, new_rows, new_cols = [], [], [], []
+        for row, (customer, names) in enumerate(new_categories.items()):
+            owned = self.customer_categories.setdefault(customer, set())
+            added = set(self._category_codes(list(names))) - owned
+            old_rows.extend([row] * len(owned))
+            old_cols.extend(owned)
+            new_rows.extend([row] * len(added))
+            new_cols.extend(added)
+            owned |= added
+
+        # With O the touched customers' previous incidence and D their newly
+        # bought categories: (O + D)^T (O + D) - O^T O = D^T D + D^T O + O^T D
+        shape = (len(new_categories), len(self.categories))
+        old = sparse.csr_matrix((np.ones(len(old_rows), dtype=np.int64), (old_rows, old_cols)), shape=shape)
+        new = sparse.csr_matrix((np.ones(len(new_rows), dtype=np.int64), (new_rows, new_cols)), shape=shape)
+        cross = new.T @ old
+        self.category_counts += (new.T @ new + cross + cross.T).toarray()
+
+        # Plain Python value, so it can be passed back to pyodbc as a parameter
+        latest = max(df['SaleKey'].tolist())
+        self.watermark = latest if self.watermark is None else max(self.watermark, latest)
+        self.updated_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+    def customer_product_frame(self):
+        """
+        Distinct (CustomerID, ProductID) purchases as a DataFrame of strings.
+        """
+        customers = list(self.customer_products)
+        sizes = [len(self.customer_products[c]) for c in customers]
+        return pd.DataFrame({
+            'CustomerID': np.repeat(np.array(customers, dtype=object), sizes),
+            'ProductID': [p for c in customers for p in self.customer_products[c]]
+        })
+
+
+def load_state(path=copurchase_state_path):
+    state = CopurchaseState()
+    if not os.path.exists(path):
+        return state
+    try:
+        fields = joblib.load(path)
+    except AttributeError:
+        # Pickled as a class instance by an older `python -m app.copurchase_state` (__main__.CopurchaseState)
+        return state
+    if not isinstance(fields, dict) or fields.get('version') != COPURCHASE_STATE_VERSION:
+        # Layout changed: start over from the full history
+        return state
+    state.__dict__.update(fields)
+    return state
+
+
+def save_state(state, path=copurchase_state_path):
+    # Plain dicts and arrays, so the file loads whichever module the class was run as
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    joblib.dump(dict(vars(state)), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def load_new_sales(conn, watermark):
+    query = f"""
+    SELECT
+        F.{SALES_WATERMARK_COLUMN} AS SaleKey,
+        F.CustomerID,
+        F.ProductID,
+        D.BK_Category,
+        P.PK_Product AS CatalogProduct
+    FROM Fact_SalesPerformance F
+    LEFT JOIN DimProduct P ON F.ProductID = P.PK_Product
+    LEFT JOIN DimCategory D ON F.CategoryID = D.PK_Category
+    WHERE F.CustomerID IS NOT NULL
+      AND F.ProductID IS NOT NULL
+      AND F.SalesTransactions_Amount IS NOT NULL
+    """
+    if watermark is None:
+        return pd.read_sql(query, conn)
+    return pd.read_sql(query + f"  AND F.{SALES_WATERMARK_COLUMN} > ?", conn, params=[watermark])
+
+
+def update_copurchase_state(conn=None, path=copurchase_state_path):
+    """
+    Update job: read only the sales past the stored watermark, fold them into
+    the persisted state and save it. The first run reads the full history.
+    """
+    state = load_state(path)
+    df = load_new_sales(conn or get_db_connection(), state.watermark)
+    state.apply_sales(df)
+    save_state(state, path)
+    return state, len(df)
+
+
+if __name__ == '__main__':
+    # Run through the package module so its classes are the ones everybody else imports
+    from app.copurchase_state import update_copurchase_state
+    state, n_rows = update_copurchase_state()
+    print(f"✅ Co-purchase state updated with {n_rows} new sales "
+          f"({len(state.customer_products)} customers, {len(state.categories)} categories, "
+          f"watermark {state.watermark})")
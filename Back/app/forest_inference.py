@@ -0,0 +1,124 @@
+# app/forest_inference.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Levels stepped between checks for cursors that reached a leaf
+CHECK_EVERY = 3
+# From about this many rows sklearn's compiled tree loop is faster than stepping cursors in NumPy
+# (benchmarks/bench_forest.py: even at 500 rows, 2.5x slower at 100k), so larger batches go to it
+SKLEARN_BATCH_ROWS = 400
+
+
+def _float32_at_most(values):
+    # Largest float32 <= each float64 value: for float32 x, x <= t exactly when x <= this
+    rounded = values.astype(np.float32)
+    too_big = rounded.astype(np.float64) > values
+    rounded[too_big] = np.nextafter(rounded[too_big], np.float32(-np.inf))
+    return rounded
+
+
+class CompiledForest:
+    """
+    A fitted sklearn RandomForestClassifier flattened into NumPy node arrays
+    and evaluated for a whole batch at once: every (sample, tree) cursor moves
+    one level down per step, and cursors that reached a leaf are dropped from
+    the active set as they pile up.
+
+    Features are compared as float32 against thresholds rounded down to
+    float32, which gives the same splits as sklearn, so predict_proba matches
+    it. Batches of SKLEARN_BATCH_ROWS rows or more are handed to the original
+    `estimator` (when there is one), which is faster at that size.
+    """
+
+    def __init__(self, feature, threshold, children, is_leaf, leaf_values, roots, classes, estimator=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.is_leaf = is_leaf
+        self.leaf_values = leaf_values
+        self.roots = roots
+        self.classes_ = classes
+        self.estimator = estimator
+
+    @classmethod
+    def from_sklearn(cls, forest):
+        features, thresholds, children, leaves, values, roots = [], [], [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            leaf = tree.children_left < 0
+            nodes = np.arange(offset, offset + tree.node_count)
+
+            features.append(np.where(leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(leaf, np.inf, _float32_at_most(tree.threshold)).astype(np.float32))
+            # children[2 * node] is the left child, children[2 * node + 1] the right one;
+            # leaves point to themselves so finished cursors can keep stepping in place
+            children.append(np.stack([
+                np.where(leaf, nodes, tree.children_left + offset),
+                np.where(leaf, nodes, tree.children_right + offset)
+            ], axis=1).ravel())
+            leaves.append(leaf)
+            # Per-tree class probabilities at each node, as sklearn averages them
+            value = tree.value[:, 0, :]
+            totals = value.sum(axis=1, keepdims=True)
+            values.append(value / np.where(totals > 0, totals, 1))
+
+            roots.append(offset)
+            offset += tree.node_count
+
+        return cls(
+            np.concatenate(features), np.concatenate(thresholds), np.concatenate(children).astype(np.int32),
+            np.concatenate(leaves), np.concatenate(values), np.array(roots, dtype=np.int32), forest.classes_,
+            estimator=forest
+        )
+
+    def _predict_chunk(self, X):
+        n_samples, n_features = X.shape
+        n_trees = self.roots.size
+        flat = X.ravel()
+
+        # One cursor per (sample, tree), with the offset of its sample's row in `flat`
+        nodes = np.tile(self.roots, n_samples)
+        rows = np.repeat(np.arange(n_samples, dtype=np.int32) * n_features, n_trees)
+        cursors = np.arange(nodes.size, dtype=np.int32)
+        leaves = np.empty(nodes.size, dtype=np.int32)
+
+        while True:
+            # Leaves step in place, so finished cursors are only looked for every few levels
+            for _ in range(CHECK_EVERY):
+                go_right = flat[rows + self.feature[nodes]] > self.threshold[nodes]
+                nodes = self.children[2 * nodes + go_right]
+            done = self.is_leaf[nodes]
+            n_done = np.count_nonzero(done)
+            if n_done == nodes.size:
+                leaves[cursors] = nodes
+                break
+            # Compacting costs a pass too, so only do it once enough cursors finished
+            if n_done > 0.3 * nodes.size:
+                leaves[cursors[done]] = nodes[done]
+                active = ~done
+                nodes, rows, cursors = nodes[active], rows[active], cursors[active]
+
+        return self.leaf_values[leaves.reshape(n_samples, n_trees)].mean(axis=1)
+
+    def predict_proba(self, X, chunk_size=4096, workers=1):
+        """
+        Class probabilities for every row of `X`, like
+        RandomForestClassifier.predict_proba. Rows are processed in chunks of
+        `chunk_size`, spread over `workers` threads.
+        """
+        if self.estimator is not None and len(X) >= SKLEARN_BATCH_ROWS:
+            return self.estimator.predict_proba(X)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        chunks = [X[start:start + chunk_size] for start in range(0, X.shape[0], chunk_size)]
+        if not chunks:
+            return np.empty((0, len(self.classes_)))
+        if workers > 1 and len(chunks) > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                return np.concatenate(list(pool.map(self._predict_chunk, chunks)))
+        return np.concatenate([self._predict_chunk(chunk) for chunk in chunks])
+
+    def predict(self, X, **kwargs):
+        return self.classes_[np.argmax(self.predict_proba(X, **kwargs), axis=1)]
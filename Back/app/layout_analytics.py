@@ -0,0 +1,114 @@
+# app/layout_analytics.py
+
+import numpy as np
+
+from app.layout_grid import count_neighbours
+
+# Cells shoppers can walk through
+WALKABLE_TYPES = ['Walkway', 'Door', 'Cashier']
+# Cells that are neither walked through nor visited
+IGNORED_TYPES = ['Empty', 'StaffRoom']
+
+UNREACHABLE = -1
+
+
+def distance_field(passable, sources):
+    """
+    Multi-source BFS over `passable` cells, expanded one whole frontier at a
+    time with array operations. `sources` is a (ys, xs) pair of index arrays.
+    Returns an int32 array of steps from the nearest source, -1 where
+    unreachable. Sources get distance 0 even if they are not passable.
+    """
+    rows, cols = passable.shape
+    width = cols + 2
+
+    # A closed border means neighbour offsets never need bounds checks
+    open_cells = np.zeros((rows + 2, width), dtype=bool)
+    open_cells[1:-1, 1:-1] = passable
+    open_cells = open_cells.ravel()
+    dist = np.full(open_cells.size, UNREACHABLE, dtype=np.int32)
+
+    ys, xs = sources
+    frontier = np.unique((np.asarray(ys, dtype=np.int64) + 1) * width + np.asarray(xs, dtype=np.int64) + 1)
+    dist[frontier] = 0
+    offsets = np.array([-1, 1, -width, width], dtype=np.int64)
+
+    step = 0
+    while frontier.size:
+        step += 1
+        nbrs = (frontier[:, None] + offsets).ravel()
+        nbrs = nbrs[open_cells[nbrs] & (dist[nbrs] == UNREACHABLE)]
+        frontier = np.unique(nbrs)
+        dist[frontier] = step
+
+    return dist.reshape(rows + 2, width)[1:-1, 1:-1]
+
+
+def reach_distance_field(dist):
+    """
+    Distance to reach every cell from a neighbouring walkable cell: one step
+    more than its closest reachable side neighbour, -1 if none is reachable.
+    """
+    rows, cols = dist.shape
+    big = np.iinfo(np.int32).max
+    padded = np.full((rows + 2, cols + 2), big, dtype=np.int32)
+    padded[1:-1, 1:-1] = np.where(dist >= 0, dist, big)
+    nearest = np.minimum.reduce([
+        padded[1:-1, :-2], padded[1:-1, 2:], padded[:-2, 1:-1], padded[2:, 1:-1]
+    ])
+    return np.where(nearest < big, nearest + 1, UNREACHABLE).astype(np.int32)
+
+
+def door_distance_field(grid):
+    return distance_field(grid.mask(*WALKABLE_TYPES), np.nonzero(grid.mask('Door')))
+
+
+def aisle_mask(grid):
+    # Plain aisles and aisles already assigned a category ("Aisle - <category>")
+    codes = [code for code, t in enumerate(grid.legend) if t == 'Aisle' or t.startswith('Aisle - ')]
+    return np.isin(grid.codes, codes)
+
+
+def layout_metrics(grid):
+    """
+    Shopper-path metrics for a layout: how far each zone type is from the
+    doors, how exposed aisles are to walkable cells, and walkway dead ends.
+    """
+    walkable = grid.mask(*WALKABLE_TYPES)
+    dist = door_distance_field(grid)
+    reach = reach_distance_field(dist)
+    walkable_neighbours = count_neighbours(walkable)
+
+    zones = {}
+    for code, cell_type in enumerate(grid.legend):
+        if (cell_type in WALKABLE_TYPES and cell_type != 'Cashier') or cell_type in IGNORED_TYPES:
+            continue
+        cells = grid.codes == code
+        if not cells.any():
+            continue
+        # Cashiers are walked through; everything else is reached from a neighbour
+        distances = (dist if cell_type == 'Cashier' else reach)[cells]
+        reachable = distances[distances >= 0]
+        zones[cell_type] = {
+            'cells': int(cells.sum()),
+            'unreachable': int(distances.size - reachable.size),
+            'min_distance': int(reachable.min()) if reachable.size else None,
+            'mean_distance': float(reachable.mean()) if reachable.size else None
+        }
+
+    aisles = aisle_mask(grid)
+    exposure = walkable_neighbours[aisles]
+    reachable_walkable = dist[walkable] >= 0
+
+    return {
+        'rows': grid.rows,
+        'cols': grid.cols,
+        'walkable_cells': int(walkable.sum()),
+        'unreachable_walkable_cells': int((~reachable_walkable).sum()),
+        'max_door_distance': int(dist.max()) if reachable_walkable.any() else None,
+        'zones': zones,
+        'aisle_cells': int(aisles.sum()),
+        'average_aisle_exposure': float(exposure.mean()) if exposure.size else 0.0,
+        'unexposed_aisle_cells': int((exposure == 0).sum()),
+        'dead_ends': int((walkable & (walkable_neighbours == 1)).sum())
+    }
@@ -0,0 +1,60 @@
+# app/layout_cache.py
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class LayoutCache:
+    """
+    Thread-safe LRU cache of layout results, keyed by a hash of the input grid
+    and every parameter that affects the result.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(name, grid=None, **params):
+        digest = hashlib.sha256(name.encode())
+        if grid is not None:
+            digest.update(json.dumps([grid.rows, grid.cols, grid.legend]).encode())
+            digest.update(grid.codes.tobytes())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._entries), 'maxsize': self.maxsize, 'hits': self.hits, 'misses': self.misses}
+
+
+layout_cache = LayoutCache(maxsize=int(os.getenv('LAYOUT_CACHE_SIZE', 128)))
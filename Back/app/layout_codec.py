@@ -0,0 +1,87 @@
+# app/layout_codec.py
+
+import numpy as np
+
+from app.layout_grid import LayoutGrid
+
+# Clients opt in to the compact format with ?format=rle or this Accept header
+RLE_ENCODING = 'rle'
+JSON_ENCODING = 'json'
+RLE_MEDIA_TYPE = 'application/vnd.monofosm.layout-rle+json'
+
+
+def requested_encoding(args, accept_header=None):
+    """
+    Pick the grid encoding for a response from the query string or Accept header.
+    """
+    fmt = (args.get('format') or '').lower()
+    if fmt in (RLE_ENCODING, JSON_ENCODING):
+        return fmt
+    if accept_header and RLE_MEDIA_TYPE in accept_header:
+        return RLE_ENCODING
+    return JSON_ENCODING
+
+
+def encode_grid(grid, encoding=JSON_ENCODING):
+    if encoding == RLE_ENCODING:
+        return encode_rle(grid)
+    return grid.to_json()
+
+
+def decode_grid(data):
+    """
+    Build a LayoutGrid from either the verbose JSON grid or its compact form.
+    """
+    if isinstance(data, dict):
+        if data.get('encoding') != RLE_ENCODING:
+            raise ValueError(f"Unsupported grid encoding: {data.get('encoding')}")
+        return decode_rle(data)
+    return LayoutGrid.from_json(data)
+
+
+def encode_rle(grid):
+    """
+    Encode a grid as a type legend plus, for every row, a flat list of
+    alternating [code, run_length, code, run_length, ...].
+    """
+    rows, cols = grid.codes.shape
+    if not rows or not cols:
+        return {'encoding': RLE_ENCODING, 'legend': grid.legend, 'rows': rows, 'cols': cols, 'runs': [[] for _ in range(rows)]}
+
+    codes = grid.codes
+    # A run starts at the first column or wherever the code changes
+    starts = np.ones(codes.shape, dtype=bool)
+    starts[:, 1:] = codes[:, 1:] != codes[:, :-1]
+    row_idx, col_idx = np.nonzero(starts)
+    ends = np.append(col_idx[1:], cols)
+    ends[np.flatnonzero(np.diff(row_idx))] = cols
+    lengths = ends - col_idx
+
+    pairs = np.column_stack([codes[row_idx, col_idx], lengths]).ravel().tolist()
+    bounds = np.searchsorted(row_idx, np.arange(rows + 1)) * 2
+    runs = [pairs[bounds[y]:bounds[y + 1]] for y in range(rows)]
+
+    return {'encoding': RLE_ENCODING, 'legend': grid.legend, 'rows': rows, 'cols': cols, 'runs': runs}
+
+
+def decode_rle(data):
+    try:
+        legend = list(data['legend'])
+        runs = data['runs']
+        rows = len(runs)
+        flat = np.fromiter((value for row in runs for value in row), dtype=np.int64)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f'Malformed RLE grid: {e}')
+
+    codes, lengths = flat[0::2], flat[1::2]
+    if len(codes) != len(lengths) or (codes < 0).any() or (codes >= len(legend)).any() or (lengths < 0).any():
+        raise ValueError('Malformed RLE grid: runs must be [code, length] pairs indexing the legend')
+
+    cols = int(data.get('cols', lengths.sum() // rows if rows else 0))
+    row_lengths = [sum(row[1::2]) for row in runs]
+    if any(length != cols for length in row_lengths):
+        raise ValueError('Malformed RLE grid: rows must all have the same length')
+
+    dtype = np.uint8 if len(legend) <= np.iinfo(np.uint8).max + 1 else np.uint16
+    grid_codes = np.repeat(codes.astype(dtype), lengths).reshape(rows, cols)
+    return LayoutGrid(grid_codes, legend)
@@ -0,0 +1,111 @@
+# app/layout_grid.py
+
+import numpy as np
+
+# Cell types known to the front end. Any other type found in a request (e.g.
+# "Aisle - Beverages" after category placement) is appended to the legend.
+CELL_TYPES = ['Empty', 'Walkway', 'Door', 'Aisle', 'Cashier', 'StaffRoom', 'Butcher', 'FruitsVeg', 'Spices']
+
+
+class LayoutGrid:
+    """
+    Store layout held as a 2-D array of small integer cell-type codes.
+
+    `codes[y, x]` indexes into `legend`. The JSON grid of `{'type', 'x', 'y'}`
+    cells is only built or parsed at the API boundary (`from_json` / `to_json`).
+    """
+
+    def __init__(self, codes, legend=None):
+        self.codes = codes
+        self.legend = list(legend if legend is not None else CELL_TYPES)
+        self._index = {cell_type: code for code, cell_type in enumerate(self.legend)}
+
+    @classmethod
+    def filled(cls, rows, cols, cell_type='Walkway'):
+        grid = cls(np.zeros((rows, cols), dtype=np.uint8))
+        grid.codes[:] = grid.code(cell_type)
+        return grid
+
+    @classmethod
+    def from_json(cls, layout):
+        grid = cls(np.zeros((0, 0), dtype=np.uint8))
+        rows = len(layout)
+        cols = len(layout[0]) if rows else 0
+        if any(len(row) != cols for row in layout):
+            raise ValueError('Layout grid rows must all have the same length')
+
+        codes = np.fromiter(
+            (grid.code(cell['type']) for row in layout for cell in row),
+            dtype=np.uint16, count=rows * cols
+        )
+        dtype = np.uint8 if len(grid.legend) <= np.iinfo(np.uint8).max + 1 else np.uint16
+        grid.codes = codes.astype(dtype).reshape(rows, cols)
+        return grid
+
+    def to_json(self):
+        legend = self.legend
+        return [
+            [{'type': legend[code], 'x': x, 'y': y} for x, code in enumerate(row)]
+            for y, row in enumerate(self.codes.tolist())
+        ]
+
+    @property
+    def rows(self):
+        return self.codes.shape[0]
+
+    @property
+    def cols(self):
+        return self.codes.shape[1]
+
+    def copy(self):
+        return LayoutGrid(self.codes.copy(), self.legend)
+
+    def code(self, cell_type):
+        """
+        Return the code of `cell_type`, adding it to the legend if it is new.
+        """
+        code = self._index.get(cell_type)
+        if code is None:
+            code = len(self.legend)
+            if code > np.iinfo(self.codes.dtype).max:
+                self.codes = self.codes.astype(np.uint16)
+            self.legend.append(cell_type)
+            self._index[cell_type] = code
+        return code
+
+    def mask(self, *cell_types):
+        """
+        Boolean array marking the cells whose type is one of `cell_types`.
+        """
+        codes = [self._index[t] for t in cell_types if t in self._index]
+        if len(codes) == 1:
+            return self.codes == codes[0]
+        return np.isin(self.codes, codes)
+
+    def type_at(self, x, y):
+        return self.legend[self.codes[y, x]]
+
+    def set_type(self, x, y, cell_type):
+        self.codes[y, x] = self.code(cell_type)
+
+
+def count_neighbours(mask):
+    """
+    For every cell, count how many of its four side neighbours are set in
+    `mask`. Cells outside the grid count as unset.
+    """
+    counts = np.zeros(mask.shape, dtype=np.uint8)
+    counts[:, 1:] += mask[:, :-1]
+    counts[:, :-1] += mask[:, 1:]
+    counts[1:, :] += mask[:-1, :]
+    counts[:-1, :] += mask[1:, :]
+    return counts
+
+
+def interior_mask(rows, cols):
+    """
+    Cells whose four side neighbours are all inside the grid.
+    """
+    mask = np.zeros((rows, cols), dtype=bool)
+    mask[1:-1, 1:-1] = True
+    return mask
@@ -1,31 +1,58 @@
 # app/layout_optimizer.py
 
+import os
 import random
+import time
 from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait
 
+import numpy as np
 
-def generate_layout_template(width, height, cell_size):
+from app.layout_cache import layout_cache
+from app.layout_codec import JSON_ENCODING, decode_grid, encode_grid
+from app.layout_grid import LayoutGrid, count_neighbours, interior_mask
+from app.layout_scoring import score_layout
+from app.walkway_connectivity import WalkwayConnectivity
+
+# Part of every cache key: bump whenever a change alters optimisation results
+LAYOUT_ALGORITHM_VERSION = 1
+
+
+def build_layout_template(width, height, cell_size):
+    rows = int(height / cell_size)
+    cols = int(width / cell_size)
+    grid = LayoutGrid.filled(rows, cols, 'Walkway')
+
+    # Example: Add default entrance in top-left
+    grid.set_type(0, 0, 'Door')
+    return grid
+
+
+def generate_layout_template(width, height, cell_size, encoding=JSON_ENCODING):
     """
     Generate a basic layout grid template for the store.
     """
     try:
-        rows = int(height / cell_size)
-        cols = int(width / cell_size)
-        layout = [[{'type': 'Walkway', 'x': x, 'y': y} for x in range(cols)] for y in range(rows)]
-
-        # Example: Add default entrance in top-left
-        layout[0][0]['type'] = 'Door'
-
-        return {
-            'grid': layout,
-            'rows': rows,
-            'cols': cols,
-            'cell_size': cell_size
-        }
+        key = layout_cache.key('template', width=width, height=height, cell_size=cell_size,
+                               version=LAYOUT_ALGORITHM_VERSION)
+        grid = layout_cache.get(key)
+        if grid is None:
+            grid = frozen(build_layout_template(width, height, cell_size))
+            layout_cache.put(key, grid)
+        return layout_response(grid, cell_size, encoding)
     except Exception as e:
         return {'error': str(e)}
 
 
+def layout_response(grid, cell_size, encoding=JSON_ENCODING):
+    return {
+        'grid': encode_grid(grid, encoding),
+        'rows': grid.rows,
+        'cols': grid.cols,
+        'cell_size': cell_size
+    }
+
+
 def is_within_bounds(x, y, rows, cols):
     return 0 <= x < cols and 0 <= y < rows
 
@@ -34,175 +61,353 @@ def get_neighbors(x, y):
     return [(x + dx, y + dy) for dx, dy in [(-1, 0), (1, 0), (0, -1), (0, 1)]]
 
 
-def count_adjacent_type(layout, x, y, rows, cols, target_type):
-    return sum(
-        1 for nx, ny in get_neighbors(x, y)
-        if is_within_bounds(nx, ny, rows, cols) and layout[ny][nx]['type'] == target_type
-    )
-
+def get_adjacent_cells(x, y, rows, cols):
+    return [(nx, ny) for nx, ny in get_neighbors(x, y) if is_within_bounds(nx, ny, rows, cols)]
 
-def ensure_walkways(layout, rows, cols):
-    for y in range(1, rows - 1):
-        if all(layout[y][x]['type'] != 'Walkway' for x in range(cols)):
-            x = random.randint(1, cols - 2)
-            layout[y][x]['type'] = 'Walkway'
-    for x in range(1, cols - 1):
-        if all(layout[y][x]['type'] != 'Walkway' for y in range(rows)):
-            y = random.randint(1, rows - 2)
-            layout[y][x]['type'] = 'Walkway'
 
+def ensure_walkways(grid, rng=random):
+    rows, cols = grid.rows, grid.cols
+    walkway = grid.code('Walkway')
 
-def find_door_locations(layout, rows, cols):
-    return [(x, y) for y in range(rows) for x in range(cols) if layout[y][x]['type'] == 'Door']
+    for y in np.flatnonzero(~(grid.codes[1:rows - 1] == walkway).any(axis=1)) + 1:
+        x = rng.randint(1, cols - 2)
+        grid.codes[y, x] = walkway
+    for x in np.flatnonzero(~(grid.codes[:, 1:cols - 1] == walkway).any(axis=0)) + 1:
+        y = rng.randint(1, rows - 2)
+        grid.codes[y, x] = walkway
 
 
-def get_adjacent_cells(x, y, rows, cols):
-    return [(nx, ny) for nx, ny in get_neighbors(x, y) if is_within_bounds(nx, ny, rows, cols)]
+def find_door_locations(grid):
+    ys, xs = np.nonzero(grid.mask('Door'))
+    return list(zip(xs.tolist(), ys.tolist()))
 
 
-def is_walkway_connected(layout, rows, cols):
-    visited = set()
-    walkways = [(x, y) for y in range(rows) for x in range(cols) if layout[y][x]['type'] == 'Walkway']
-    if not walkways:
+def is_walkway_connected(grid):
+    walkways = grid.mask('Walkway')
+    total = int(walkways.sum())
+    if not total:
         return True
 
-    queue = deque([walkways[0]])
-    visited.add(walkways[0])
+    rows, cols = grid.rows, grid.cols
+    open_cells = walkways.tolist()
+    ys, xs = np.nonzero(walkways)
+    start = (int(xs[0]), int(ys[0]))
+    visited = {start}
+    queue = deque([start])
 
     while queue:
         x, y = queue.popleft()
         for nx, ny in get_neighbors(x, y):
             if is_within_bounds(nx, ny, rows, cols):
-                if layout[ny][nx]['type'] == 'Walkway' and (nx, ny) not in visited:
+                if open_cells[ny][nx] and (nx, ny) not in visited:
                     visited.add((nx, ny))
                     queue.append((nx, ny))
 
-    return len(visited) == len(walkways)
+    return len(visited) == total
 
 
-def find_valid_cashier_spots(layout, door_locs, rows, cols):
+def find_valid_cashier_spots(grid, door_locs):
+    # A spot must be a walkway whose neighbours are only Door/Walkway/Cashier
+    disallowed = ~grid.mask('Door', 'Walkway', 'Cashier')
+    valid = grid.mask('Walkway') & (count_neighbours(disallowed) == 0)
+
     cashier_spots = []
     for dx, dy in door_locs:
-        for x, y in get_adjacent_cells(dx, dy, rows, cols):
-            if layout[y][x]['type'] == 'Walkway':
-                # Ensure surrounding cells are only Door/Walkway/Cashier
-                valid = True
-                for nx, ny in get_neighbors(x, y):
-                    if is_within_bounds(nx, ny, rows, cols):
-                        ntype = layout[ny][nx]['type']
-                        if ntype not in ['Door', 'Walkway', 'Cashier']:
-                            valid = False
-                            break
-                if valid:
-                    cashier_spots.append((x, y))
+        for x, y in get_adjacent_cells(dx, dy, grid.rows, grid.cols):
+            if valid[y, x]:
+                cashier_spots.append((x, y))
     return cashier_spots
 
 
-def place_cashiers(layout, door_locs, rows, cols):
-    cashier_spots = find_valid_cashier_spots(layout, door_locs, rows, cols)
+def place_cashiers(grid, door_locs):
+    cashier_spots = find_valid_cashier_spots(grid, door_locs)
     used = set()
     for x, y in cashier_spots:
         if (x, y) not in used:
-            layout[y][x]['type'] = 'Cashier'
+            grid.set_type(x, y, 'Cashier')
             used.add((x, y))
             if len(used) >= 2:
                 break
 
 
-def is_valid_zone_placement(layout, x, y, rows, cols, avoid_types):
-    return all(
-        is_within_bounds(nx, ny, rows, cols) and layout[ny][nx]['type'] not in avoid_types
-        for nx, ny in get_neighbors(x, y)
-    )
-
-
-def place_zone(layout, rows, cols, zone_type, avoid_types, size=1, connected=False):
-    tries = 1000
-    while tries > 0:
-        tries -= 1
-        x = random.randint(1, cols - 2)
-        y = random.randint(1, rows - 2)
+class ZoneCandidates:
+    """
+    Per-cell neighbour counts used to find where zones can go, kept up to date
+    as cells are converted so each placement doesn't rescan the whole grid.
+    """
 
-        if layout[y][x]['type'] != 'Walkway':
-            continue
-        if count_adjacent_type(layout, x, y, rows, cols, 'Walkway') < 3:
-            continue
-        if not is_valid_zone_placement(layout, x, y, rows, cols, avoid_types):
+    def __init__(self, grid):
+        self.grid = grid
+        self.walkways = grid.mask('Walkway')
+        self.walkway_counts = count_neighbours(self.walkways)
+        self.interior = interior_mask(grid.rows, grid.cols)
+        self.type_counts = {}
+
+    def neighbour_counts(self, cell_type):
+        if cell_type not in self.type_counts:
+            self.type_counts[cell_type] = count_neighbours(self.grid.mask(cell_type))
+        return self.type_counts[cell_type]
+
+    def valid_mask(self, avoid_types):
+        """
+        Walkways whose side neighbours are all inside the grid and none of `avoid_types`.
+        """
+        valid = self.walkways & self.interior
+        for cell_type in avoid_types:
+            valid &= self.neighbour_counts(cell_type) == 0
+        return valid
+
+    def seed_mask(self, avoid_types):
+        return self.valid_mask(avoid_types) & (self.walkway_counts >= 3)
+
+    def convert(self, x, y, zone_type):
+        self.grid.set_type(x, y, zone_type)
+        self.walkways[y, x] = False
+        for nx, ny in get_adjacent_cells(x, y, self.grid.rows, self.grid.cols):
+            self.walkway_counts[ny, nx] -= 1
+            if zone_type in self.type_counts:
+                self.type_counts[zone_type][ny, nx] += 1
+
+
+def place_zone(grid, zone_type, avoid_types, size=1, connected=False, rng=random, candidates=None):
+    """
+    Convert a random valid walkway (or, when `connected`, a cluster of `size`
+    adjacent ones) into `zone_type`. Seeds are drawn from the cells that
+    satisfy the constraints, so this only returns False when no placement
+    exists.
+    """
+    rows, cols = grid.rows, grid.cols
+    if candidates is None:
+        candidates = ZoneCandidates(grid)
+    growable = candidates.valid_mask(avoid_types)
+    pool = np.flatnonzero(candidates.seed_mask(avoid_types)).tolist()
+    exhausted = set()
+
+    while pool:
+        # Draw without replacement: swap the pick to the end and pop it
+        i = rng.randrange(len(pool))
+        pool[i], pool[-1] = pool[-1], pool[i]
+        y, x = divmod(pool.pop(), cols)
+        if (x, y) in exhausted:
             continue
 
         if connected and size > 1:
             cluster = [(x, y)]
+            in_cluster = {(x, y)}
             for _ in range(size - 1):
-                candidates = [
+                options = [
                     (nx, ny) for cx, cy in cluster
-                    for nx, ny in get_neighbors(cx, cy)
-                    if is_within_bounds(nx, ny, rows, cols)
-                       and layout[ny][nx]['type'] == 'Walkway'
-                       and (nx, ny) not in cluster
-                       and is_valid_zone_placement(layout, nx, ny, rows, cols, avoid_types)
+                    for nx, ny in get_adjacent_cells(cx, cy, rows, cols)
+                    if growable[ny, nx] and (nx, ny) not in in_cluster
                 ]
-                if not candidates:
+                if not options:
                     break
-                cluster.append(random.choice(candidates))
-            if len(cluster) == size:
-                for cx, cy in cluster:
-                    layout[cy][cx]['type'] = zone_type
-                return True
+                cell = rng.choice(options)
+                cluster.append(cell)
+                in_cluster.add(cell)
+            if len(cluster) < size:
+                # The cluster filled its whole region of valid cells, so no
+                # seed inside that region can work either
+                exhausted |= in_cluster
+                continue
+            for cx, cy in cluster:
+                candidates.convert(cx, cy, zone_type)
         else:
-            layout[y][x]['type'] = zone_type
-            return True
+            candidates.convert(x, y, zone_type)
+        return True
     return False
 
 
-def place_aisles(layout, rows, cols):
-    row_walkways = {y: None for y in range(1, rows - 1)}
-    col_walkways = {x: None for x in range(1, cols - 1)}
+def place_aisles(grid):
+    rows, cols = grid.rows, grid.cols
+    walkways = grid.mask('Walkway')
 
-    # Reserve 1 walkway per row and column
-    for y in range(1, rows - 2):
-        for x in range(1, cols - 2):
-            if layout[y][x]['type'] == 'Walkway':
-                if row_walkways[y] is None:
-                    row_walkways[y] = (x, y)
-                if col_walkways[x] is None:
-                    col_walkways[x] = (x, y)
-
-    reserved = set(row_walkways.values()) | set(col_walkways.values())
+    # Reserve 1 walkway per row and column: the first one found in each
+    reserved = np.zeros_like(walkways)
+    inner = walkways[1:rows - 2, 1:cols - 2]
+    if inner.size:
+        ys = np.flatnonzero(inner.any(axis=1))
+        reserved[ys + 1, inner[ys].argmax(axis=1) + 1] = True
+        xs = np.flatnonzero(inner.any(axis=0))
+        reserved[inner[:, xs].argmax(axis=0) + 1, xs + 1] = True
 
     # Convert other walkways to aisles (only if adjacent to walkway AND skip a row vertically)
+    eligible = walkways & ~reserved & (count_neighbours(walkways) >= 1)
+    eligible[:, [0]] = False
+    eligible[:, cols - 2:] = False
+    eligible[[0], :] = False
+    eligible[rows - 2:, :] = False
     candidates = []
-    blocked = set()  # Tracks cells blocked by vertical adjacency
-    for x in range(1, cols - 2):
-        for y in range(1, rows - 2):
-            if (x, y) in blocked:
-                continue
-            if layout[y][x]['type'] == 'Walkway' and (x, y) not in reserved:
-                if count_adjacent_type(layout, x, y, rows, cols, 'Walkway') >= 1:
-                    candidates.append((x, y))
-                    blocked.add((x, y + 1))  # block row below
-
-    # Greedy convert candidates and check connectivity
+    for x, y in zip(*(axis.tolist() for axis in np.nonzero(eligible.T))):
+        if candidates and candidates[-1] == (x, y - 1):
+            continue  # blocked by the candidate just above
+        candidates.append((x, y))
+
+    # A network that is already split can't be kept connected, so nothing is converted
+    if not is_walkway_connected(grid):
+        return
+
+    # Greedy convert candidates, skipping any that would disconnect the walkways
+    connectivity = WalkwayConnectivity(walkways)
+    aisle = grid.code('Aisle')
     for x, y in candidates:
-        layout[y][x]['type'] = 'Aisle'
-        if not is_walkway_connected(layout, rows, cols):
-            layout[y][x]['type'] = 'Walkway'  # revert if disconnects
-
-
-def optimize_layout(layout, rows, cols, cell_size):
-    door_locs = find_door_locations(layout, rows, cols)
+        if connectivity.try_remove(x, y):
+            grid.codes[y, x] = aisle
 
-    ensure_walkways(layout, rows, cols)
-    place_aisles(layout, rows, cols)
-    place_cashiers(layout, door_locs, rows, cols)
 
-    place_zone(layout, rows, cols, 'Butcher', avoid_types=['FruitsVeg', 'Spices'], size=1)
-    place_zone(layout, rows, cols, 'Spices', avoid_types=['FruitsVeg', 'Butcher'], size=1)
-    fruitsveg_size = random.randint(2, 8)
-    place_zone(layout, rows, cols, 'FruitsVeg', avoid_types=['Spices', 'Butcher'], size=fruitsveg_size, connected=True)
-
-    return {
-        'grid': layout,
-        'rows': rows,
-        'cols': cols,
-        'cell_size': cell_size
-    }
+def optimize_steps(grid, rng=random, unplaced=None):
+    """
+    The optimisation of `grid`, in place, one stage at a time: yields each
+    stage's name once it is done, so callers can time stages or stop between
+    them. Zone types that have no valid cell left are appended to `unplaced`.
+    """
+    door_locs = find_door_locations(grid)
+
+    ensure_walkways(grid, rng)
+    yield 'ensure_walkways'
+    place_aisles(grid)
+    yield 'place_aisles'
+    place_cashiers(grid, door_locs)
+    yield 'place_cashiers'
+
+    candidates = ZoneCandidates(grid)
+    failed = []
+    if not place_zone(grid, 'Butcher', avoid_types=['FruitsVeg', 'Spices'], size=1, rng=rng, candidates=candidates):
+        failed.append('Butcher')
+    if not place_zone(grid, 'Spices', avoid_types=['FruitsVeg', 'Butcher'], size=1, rng=rng, candidates=candidates):
+        failed.append('Spices')
+    fruitsveg_size = rng.randint(2, 8)
+    if not place_zone(grid, 'FruitsVeg', avoid_types=['Spices', 'Butcher'], size=fruitsveg_size, connected=True,
+                      rng=rng, candidates=candidates):
+        failed.append('FruitsVeg')
+    if unplaced is not None:
+        unplaced.extend(failed)
+    yield 'place_zones'
+
+
+def optimize_grid(grid, rng=random, deadline=None, unplaced=None):
+    # Past `deadline` (a time.time() value) the remaining stages are skipped and None is returned
+    for _ in optimize_steps(grid, rng, unplaced):
+        if deadline is not None and time.time() > deadline:
+            return None
+    return grid
+
+
+def frozen(grid):
+    # Cached grids are shared between requests, so make accidental edits fail loudly
+    grid.codes.flags.writeable = False
+    return grid
+
+
+def optimize_layout(layout, rows, cols, cell_size, encoding=JSON_ENCODING, seed=None):
+    """
+    Optimise a layout. With a `seed` the result is reproducible, so it is
+    served from the layout cache when the same request was seen before.
+    The response lists the zone types that found no valid cell under
+    `unplaced_zones`.
+    """
+    grid = decode_grid(layout)
+    cached = key = None
+    if seed is not None:
+        key = layout_cache.key('optimize', grid, cell_size=cell_size, seed=seed, version=LAYOUT_ALGORITHM_VERSION)
+        cached = layout_cache.get(key)
+    if cached is None:
+        unplaced = []
+        optimized = optimize_grid(grid, random.Random(seed) if seed is not None else random, unplaced=unplaced)
+        cached = (frozen(optimized), tuple(unplaced))
+        if key is not None:
+            layout_cache.put(key, cached)
+
+    optimized, unplaced = cached
+    response = layout_response(optimized, cell_size, encoding)
+    response['unplaced_zones'] = list(unplaced)
+    return response
+
+
+#! ------------------------------
+# Multi-start optimisation: run several seeded passes and keep the best-scored one
+
+_process_pool = None
+_process_pool_workers = None
+
+
+def get_process_pool(workers):
+    global _process_pool, _process_pool_workers
+    if _process_pool is None or _process_pool_workers != workers:
+        if _process_pool is not None:
+            _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = ProcessPoolExecutor(max_workers=workers)
+        _process_pool_workers = workers
+    return _process_pool
+
+
+def _optimize_candidate(codes, legend, seed, deadline=None):
+    # Runs in a worker process, so only the compact grid is sent back and forth.
+    # A candidate still running at the deadline gives up between stages and frees its worker
+    unplaced = []
+    grid = optimize_grid(LayoutGrid(codes, legend), random.Random(seed), deadline, unplaced)
+    if grid is None:
+        return None
+    return seed, grid.codes, grid.legend, score_layout(grid), unplaced
+
+
+def optimize_grid_multistart(grid, starts=8, time_budget=10.0, seed=None, workers=None):
+    """
+    Run `starts` independently seeded optimisations of `grid` across a process
+    pool and return (best_grid, best_score, best_seed, unplaced_zones) among those that finish
+    within `time_budget` seconds. The first candidate is exempt from the
+    budget, so there is always one to return; the others stop at it, between
+    stages, instead of keeping pool workers busy after the request is done.
+
+    With a `seed` every start is waited for and the budget is ignored, so the
+    result does not depend on machine load and can be cached.
+    """
+    seeder = random.Random(seed)
+    seeds = [seeder.getrandbits(32) for _ in range(starts)]
+    pool = get_process_pool(workers or os.cpu_count() or 1)
+    if seed is not None:
+        time_budget = None
+    deadline = None if time_budget is None else time.time() + time_budget
+    futures = [
+        pool.submit(_optimize_candidate, grid.codes, grid.legend, s, None if i == 0 else deadline)
+        for i, s in enumerate(seeds)
+    ]
+
+    done, pending = wait(futures, timeout=time_budget)
+    for future in pending:
+        future.cancel()
+    results = [future.result() for future in done if future.result() is not None]
+    if not results:
+        results = [futures[0].result()]
+
+    best = None
+    for candidate in results:
+        candidate_seed, _, _, score, _ = candidate
+        if best is None or (score['score'], -candidate_seed) > (best[3]['score'], -best[0]):
+            best = candidate
+
+    best_seed, codes, legend, score, unplaced = best
+    return LayoutGrid(codes, legend), score, best_seed, unplaced
+
+
+def optimize_layout_multistart(layout, rows, cols, cell_size, encoding=JSON_ENCODING,
+                               starts=8, time_budget=10.0, seed=None, workers=None):
+    grid = decode_grid(layout)
+    key = cached = None
+    if seed is not None:
+        # Seeded runs wait for every start, so the budget is not part of the result
+        key = layout_cache.key('multistart', grid, cell_size=cell_size, seed=seed, starts=starts,
+                               version=LAYOUT_ALGORITHM_VERSION)
+        cached = layout_cache.get(key)
+    if cached is None:
+        best, score, best_seed, unplaced = optimize_grid_multistart(grid, starts, time_budget, seed, workers)
+        cached = (frozen(best), score, best_seed, tuple(unplaced))
+        if key is not None:
+            layout_cache.put(key, cached)
+
+    grid, score, best_seed, unplaced = cached
+    response = layout_response(grid, cell_size, encoding)
+    response['score'] = score
+    response['seed'] = best_seed
+    response['unplaced_zones'] = list(unplaced)
+    return response
@@ -0,0 +1,64 @@
+# app/layout_scoring.py
+
+import numpy as np
+
+from app.layout_analytics import distance_field, door_distance_field, reach_distance_field
+
+ZONE_TYPES = ['Butcher', 'Spices', 'FruitsVeg']
+
+# Weights of the score components; aisle ratio is already in [0, 1]
+DISTANCE_WEIGHT = 0.5
+DISCONNECTED_PENALTY = 1.0
+MISSING_TARGET_PENALTY = 0.25
+
+
+def score_layout(grid):
+    """
+    Score an optimised layout; higher is better. Rewards shelf space and
+    penalises split walkways, long walks from the doors to the cashiers and
+    zones, and cashiers or zones that are missing or unreachable.
+    """
+    rows, cols = grid.rows, grid.cols
+    aisle_cells = int(grid.mask('Aisle').sum())
+    aisle_ratio = aisle_cells / (rows * cols) if rows and cols else 0.0
+
+    walkways = grid.mask('Walkway')
+    ys, xs = np.nonzero(walkways)
+    connected = True
+    if len(xs):
+        reached = distance_field(walkways, (ys[:1], xs[:1])) >= 0
+        connected = bool(reached[walkways].all())
+
+    door_dist = door_distance_field(grid)
+    reach = reach_distance_field(door_dist)
+
+    cashiers = grid.mask('Cashier')
+    distances = [door_dist[cashiers]]
+    missing = [] if cashiers.any() else ['Cashier']
+    for zone_type in ZONE_TYPES:
+        cells = grid.mask(zone_type)
+        if not cells.any():
+            missing.append(zone_type)
+        distances.append(reach[cells])
+
+    distances = np.concatenate(distances)
+    reachable = distances[distances >= 0]
+    unreachable = int(distances.size - reachable.size)
+    mean_distance = float(reachable.mean()) if reachable.size else None
+
+    score = aisle_ratio
+    if mean_distance is not None:
+        score -= DISTANCE_WEIGHT * mean_distance / (rows + cols)
+    if not connected:
+        score -= DISCONNECTED_PENALTY
+    score -= MISSING_TARGET_PENALTY * (len(missing) + unreachable)
+
+    return {
+        'score': float(score),
+        'aisle_cells': aisle_cells,
+        'aisle_ratio': float(aisle_ratio),
+        'walkways_connected': connected,
+        'mean_door_distance': mean_distance,
+        'unreachable_targets': unreachable,
+        'missing': missing
+    }
@@ -0,0 +1,147 @@
+# app/layout_simulation.py
+
+import numpy as np
+
+from app.layout_analytics import WALKABLE_TYPES, aisle_mask, distance_field, door_distance_field, reach_distance_field
+
+ZONE_TYPES = ['Butcher', 'Spices', 'FruitsVeg']
+
+# Flush buffered shopper positions into the heatmap once this many are queued
+HEATMAP_BUFFER_SIZE = 1_000_000
+
+
+def target_fields(grid, targets):
+    """
+    One distance field per target cell, measured from the walkable cells next
+    to it, stacked into a (len(targets), rows + 2, cols + 2) array with a
+    closed border. Unreachable cells hold a large value.
+    """
+    rows, cols = grid.rows, grid.cols
+    walkable = grid.mask(*WALKABLE_TYPES)
+    big = np.iinfo(np.int32).max
+    fields = np.full((len(targets), rows + 2, cols + 2), big, dtype=np.int32)
+
+    for i, sources in enumerate(targets):
+        dist = distance_field(walkable, sources)
+        fields[i, 1:-1, 1:-1] = np.where(dist >= 0, dist, big)
+    return fields
+
+
+def walkable_sides(walkable, y, x):
+    rows, cols = walkable.shape
+    cells = [(ny, nx) for ny, nx in ((y - 1, x), (y + 1, x), (y, x - 1), (y, x + 1))
+             if 0 <= ny < rows and 0 <= nx < cols and walkable[ny, nx]]
+    return np.array([c[0] for c in cells], dtype=np.int64), np.array([c[1] for c in cells], dtype=np.int64)
+
+
+def simulate_shoppers(grid, n_shoppers=10000, basket_size=5, max_targets=128, seed=None, max_steps=None):
+    """
+    Simulate shoppers who enter at a random Door, walk to a random basket of
+    Aisle/zone cells in order and leave through the nearest Cashier (or Door
+    if there are none). Every shopper follows a shortest path on precomputed
+    distance fields and all shoppers are stepped together as arrays.
+
+    Baskets are drawn from at most `max_targets` cells, one distance field
+    each: every reachable zone cell, plus one random aisle cell from each of
+    the remaining equal slices of the aisles (in row-major order), weighted
+    by its slice size. Targets therefore cover the whole store and each
+    aisle cell keeps its share of visits; more targets give a finer heatmap.
+
+    Returns the per-cell visit counts and summary statistics.
+    """
+    if n_shoppers < 1 or basket_size < 1 or max_targets < 1:
+        raise ValueError('shoppers, basket_size and max_targets must be at least 1')
+    rng = np.random.default_rng(seed)
+    rows, cols = grid.rows, grid.cols
+    width = cols + 2
+    walkable = grid.mask(*WALKABLE_TYPES)
+
+    doors = np.flatnonzero(grid.mask('Door'))
+    if not doors.size:
+        raise ValueError('Layout has no Door cell to enter from')
+
+    # Candidate basket items: aisle and zone cells reachable from the doors
+    reach = reach_distance_field(door_distance_field(grid))
+    zones = np.flatnonzero(grid.mask(*ZONE_TYPES) & (reach >= 0))
+    aisles = np.flatnonzero(aisle_mask(grid) & ~grid.mask(*ZONE_TYPES) & (reach >= 0))
+    if not zones.size and not aisles.size:
+        raise ValueError('Layout has no reachable Aisle or zone cell to visit')
+    zones = rng.permutation(zones)[:max_targets]
+    weights = np.ones(zones.size)
+    n_aisles = min(max_targets - zones.size, aisles.size)
+    if n_aisles:
+        # One random cell per slice stands for the whole slice
+        bounds = np.linspace(0, aisles.size, n_aisles + 1).astype(np.int64)
+        aisles = aisles[bounds[:-1] + (rng.random(n_aisles) * np.diff(bounds)).astype(np.int64)]
+        weights = np.r_[weights, np.diff(bounds)]
+    items = np.r_[zones, aisles[:n_aisles]]
+
+    exits = grid.mask('Cashier') if grid.mask('Cashier').any() else grid.mask('Door')
+    targets = [walkable_sides(walkable, *divmod(int(item), cols)) for item in items]
+    targets.append(np.nonzero(exits))
+    fields = target_fields(grid, targets).reshape(len(targets), -1)
+    exit_field = len(targets) - 1
+
+    # Legs: basket items in order, then the exit
+    basket = rng.choice(len(items), size=(n_shoppers, basket_size), p=weights / weights.sum())
+    legs = np.column_stack([basket, np.full(n_shoppers, exit_field)])
+    leg = np.zeros(n_shoppers, dtype=np.int64)
+
+    start_y, start_x = np.divmod(rng.choice(doors, size=n_shoppers), cols)
+    pos = (start_y + 1) * width + start_x + 1
+    offsets = np.array([-1, 1, -width, width], dtype=np.int64)
+    big = np.iinfo(np.int32).max
+
+    visits = np.zeros(fields.shape[1], dtype=np.int64)
+    path_lengths = np.zeros(n_shoppers, dtype=np.int64)
+    skipped = 0
+    buffered = [pos.copy()]
+    buffered_size = pos.size
+    shoppers = np.arange(n_shoppers)
+    max_steps = max_steps or 4 * (basket_size + 1) * rows * cols
+
+    steps = 0
+    while shoppers.size and steps < max_steps:
+        field = legs[shoppers, leg[shoppers]]
+        here = fields[field, pos[shoppers]]
+
+        # Reached the current target (or it can't be reached): go to the next leg
+        arrived = here == 0
+        unreachable = here == big
+        skipped += int(unreachable.sum())
+        advance = arrived | unreachable
+        if advance.any():
+            leg[shoppers[advance]] += 1
+            finished = leg[shoppers] > basket_size
+            shoppers = shoppers[~finished]
+            continue
+
+        # Step downhill, breaking ties between equally short moves at random
+        nbrs = pos[shoppers, None] + offsets
+        cost = fields[field[:, None], nbrs] + rng.random(nbrs.shape)
+        pos[shoppers] = nbrs[np.arange(shoppers.size), cost.argmin(axis=1)]
+        path_lengths[shoppers] += 1
+        steps += 1
+
+        buffered.append(pos[shoppers].copy())
+        buffered_size += shoppers.size
+        if buffered_size >= HEATMAP_BUFFER_SIZE:
+            visits += np.bincount(np.concatenate(buffered), minlength=visits.size)
+            buffered, buffered_size = [], 0
+
+    if buffered:
+        visits += np.bincount(np.concatenate(buffered), minlength=visits.size)
+    heatmap = visits.reshape(rows + 2, width)[1:-1, 1:-1]
+
+    return {
+        'heatmap': heatmap,
+        'shoppers': n_shoppers,
+        'unfinished_shoppers': int(shoppers.size),
+        'skipped_targets': skipped,
+        'steps': steps,
+        'mean_path_length': float(path_lengths.mean()),
+        'max_visits': int(heatmap.max()),
+        'busy_walkable_cells': int(((heatmap > 0) & walkable).sum()),
+        'mean_walkable_congestion': float(heatmap[walkable].mean()) if walkable.any() else 0.0,
+        'exposed_targets': int(items.size)
+    }
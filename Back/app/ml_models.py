@@ -3,9 +3,6 @@
 import pyodbc
 import pandas as pd
 import numpy as np
-from sklearn.neighbors import NearestNeighbors
-import itertools
-import random
 import joblib
 import os
 import json
@@ -15,6 +12,14 @@ from prophet import Prophet
 import requests
 from dotenv import load_dotenv
 
+from app.embedding_index import EmbeddingIndex
+from app.forest_inference import CompiledForest
+from app.model_registry import embedding_matrix_paths, load_embedding_matrix, model_registry
+from app.pair_sampling import pair_features, sample_index_pairs
+from app.pair_table import load_pair_table
+from app.reference_data import reference_data
+from app.supplier_index import SupplierIndex
+
 load_dotenv()
 
 
@@ -65,95 +70,105 @@ def load_supplier_data():
 
 
 # --- Step 3: Recommend suppliers ---
-def recommend_suppliers(category, n_recommendations=5, preferred_country='France'):
-    df = load_supplier_data()
-    df_suppliers = df.dropna()
-
-    features = ['AvgSupplierPrice', 'DisputeRate', 'NumberOfTransactions']
-    category_df = df_suppliers[df_suppliers['Category'] == category]
+# Scaled features and KNN index per category, rebuilt in the background every REFERENCE_DATA_TTL seconds
+reference_data.register('supplier_index', lambda: SupplierIndex(load_supplier_data()))
 
-    if category_df.empty:
-        return {"message": "No suppliers available for this category."}
 
-    n_neighbors = min(n_recommendations + 1, len(category_df))
-    if n_neighbors <= 1:
-        return {"message": f"Not enough suppliers in category {category} for recommendations."}
-
-    scaler = MinMaxScaler()
-    category_scaled = scaler.fit_transform(category_df[features])
+def recommend_suppliers(category, n_recommendations=5, preferred_country='France'):
+    return reference_data.get('supplier_index').recommend(category, n_recommendations, preferred_country)
 
-    knn = NearestNeighbors(n_neighbors=n_neighbors, metric='euclidean')
-    knn.fit(category_scaled)
 
-    random_supplier_index = np.random.randint(0, len(category_df))
-    distances, indices = knn.kneighbors([category_scaled[random_supplier_index]])
+def recommend_suppliers_batch(categories='all', n_recommendations=5, preferred_country='France'):
+    # `categories` is a list of categories, or 'all'; results are keyed by category
+    return reference_data.get('supplier_index').recommend_many(
+        None if categories == 'all' else categories, n_recommendations, preferred_country
+    )
 
-    idx_list = indices.flatten()[1:]
 
-    recommendations = []
-    for pos in idx_list:
-        supplier = category_df.iloc[pos]
-        has_disputes = "Has Disputes" if float(supplier['DisputeRate']) > 0 else "No Disputes"
-        supplier_id = supplier['PK_Supplier']
-        original_price = df[df['PK_Supplier'] == supplier_id]['AvgSupplierPrice'].values[0]
+#! ------------------------------
 
-        recommendations.append({
-            'SupplierName': str(supplier['SupplierName']),
-            'Country': str(supplier['Country']),
-            'AvgSupplierPrice': float(original_price),
-            'HasDisputes': str(has_disputes),  # STR not BOOL!
-            'NumberOfTransactions': int(supplier['NumberOfTransactions'])
-        })
 
-    # Sort France suppliers first
-    recommendations_sorted = sorted(
-        recommendations,
-        key=lambda x: (x['Country'] != preferred_country, x['AvgSupplierPrice'])
-    )
+# Pre-trained model and embeddings, loaded on first use through the model registry
+model_path = os.path.join('app', 'models', 'rf_model.pkl')
+embeddings_path = os.path.join('app', 'models', 'product_embeddings.pkl')
 
-    return recommendations_sorted
 
+def load_product_embeddings():
+    # Row i of the (memory-mapped) matrices is the embedding of ids[i], raw and unit-normalised
+    ids, matrix, unit = load_embedding_matrix(embeddings_path)
+    return ids, matrix, {p: i for i, p in enumerate(ids)}, unit
 
-#! ------------------------------
 
+def load_rf_model():
+    # The NumPy tree engine (default) is much faster on request-sized batches and hands large ones
+    # to sklearn; RF_INFERENCE=sklearn serves every batch with sklearn
+    forest = joblib.load(model_path)
+    if os.getenv('RF_INFERENCE', 'compiled') == 'compiled':
+        return CompiledForest.from_sklearn(forest)
+    return forest
 
-# Load pre-trained model and embeddings
-model_path = os.path.join('app', 'models', 'rf_model.pkl')
-embeddings_path = os.path.join('app', 'models', 'product_embeddings.pkl')
 
-rf_clf = joblib.load(model_path)
-product_embeddings = joblib.load(embeddings_path)
+model_registry.register('rf_model', load_rf_model, model_path)
+model_registry.register('product_embeddings', load_product_embeddings,
+                        embeddings_path, lambda: embedding_matrix_paths(embeddings_path))
+# Nearest-neighbour index used to shortlist pair candidates: exact or ivf (approximate).
+# It is built on the unit-normalised memory map, so exact mode keeps no copy of its own
+model_registry.register('product_index', lambda: EmbeddingIndex(
+    model_registry.get('product_embeddings')[3], mode=os.getenv('PRODUCT_INDEX_MODE', 'exact'), normalised=True
+), depends_on=('product_embeddings',))
 
 
-def get_product_name_mapping():
+def load_product_name_mapping():
     conn = get_db_connection()
     query = """
     SELECT PK_Product, Name
     FROM [DW_Monoprix].[dbo].[DimProduct]
     """
     df = pd.read_sql(query, conn)
+    conn.close()
     return dict(zip(df['PK_Product'].astype(str), df['Name']))
 
 
-def get_top_product_pairs(n_pairs=20):
-    products = list(product_embeddings.keys())
-    product_name_mapping = get_product_name_mapping()
+reference_data.register('product_names', load_product_name_mapping)
+
+
+def get_product_name_mapping():
+    # Served from the reference-data cache, refreshed at most once per TTL
+    return reference_data.get('product_names')
 
-    # Random product pairs
-    possible_pairs = list(itertools.combinations(products, 2))
-    sampled_pairs = random.sample(possible_pairs, min(500, len(possible_pairs)))
 
-    def pair_embedding(pair):
-        return np.concatenate([product_embeddings[pair[0]], product_embeddings[pair[1]]])
+def sample_top_product_pairs(n_pairs=20):
+    # Fallback before the pair table is built: best of 500 random pairs
+    product_ids, product_matrix, _, _ = model_registry.get('product_embeddings')
+    first, second = sample_index_pairs(len(product_ids), 500)
+    if not first.size:
+        return []
+    sampled_pairs = [(product_ids[i], product_ids[j]) for i, j in zip(first.tolist(), second.tolist())]
 
-    X_pairs = np.array([pair_embedding(pair) for pair in sampled_pairs])
-    y_probas = rf_clf.predict_proba(X_pairs)[:, 1]
+    X_pairs = pair_features(product_matrix, first, second)
+    y_probas = model_registry.get('rf_model').predict_proba(X_pairs)[:, 1]
 
     pair_scores = list(zip(sampled_pairs, y_probas))
     sorted_pairs = sorted(pair_scores, key=lambda x: x[1], reverse=True)
+    return sorted_pairs[:n_pairs]
+
+
+def get_top_product_pairs(n_pairs=20):
+    """
+    Top product pairs from the precomputed pair table (python -m app.pair_table),
+    or from a live-scored sample while that table is missing or outdated.
+    """
+    product_name_mapping = get_product_name_mapping()
+
+    try:
+        table = load_pair_table()
+        top = list(zip(zip(table['product1'][:n_pairs], table['product2'][:n_pairs]), table['scores'][:n_pairs]))
+    except (FileNotFoundError, ValueError):
+        # Not built yet, or built by an older version (ValueError): score a sample live until it is rebuilt
+        top = sample_top_product_pairs(n_pairs)
 
     top_pairs = []
-    for (prod1, prod2), score in sorted_pairs[:n_pairs]:
+    for (prod1, prod2), score in top:
         top_pairs.append({
             "product1_name": product_name_mapping.get(str(prod1), "Unknown"),
             "product2_name": product_name_mapping.get(str(prod2), "Unknown"),
@@ -163,6 +178,41 @@ def get_top_product_pairs(n_pairs=20):
     return top_pairs
 
 
+def get_product_pairs(product_id, n_pairs=10, n_candidates=50):
+    """
+    Products that go with `product_id`: its nearest embeddings are shortlisted
+    and re-ranked by the RandomForest in one batch. None if the product is
+    unknown.
+    """
+    product_ids, product_matrix, product_positions, _ = model_registry.get('product_embeddings')
+    row = product_positions.get(str(product_id))
+    if row is None:
+        return None
+
+    candidates, similarities = model_registry.get('product_index').neighbours(row, max(n_candidates, n_pairs))
+    if candidates.size:
+        X_pairs = pair_features(product_matrix, np.full(candidates.size, row), candidates)
+        scores = model_registry.get('rf_model').predict_proba(X_pairs)[:, 1]
+    else:
+        scores = np.empty(0)
+    order = np.argsort(-scores, kind='stable')[:n_pairs]
+
+    product_name_mapping = get_product_name_mapping()
+    return {
+        "product_id": str(product_id),
+        "product_name": product_name_mapping.get(str(product_id), "Unknown"),
+        "pairs": [
+            {
+                "product_id": str(product_ids[candidates[i]]),
+                "product_name": product_name_mapping.get(str(product_ids[candidates[i]]), "Unknown"),
+                "score": float(scores[i]),
+                "similarity": float(similarities[i])
+            }
+            for i in order
+        ]
+    }
+
+
 #! ------------------------------
 
 
@@ -309,11 +359,13 @@ def ask_llm(prompt, model="mistral"):
 sco_model_path = os.path.join('app', 'models', 'sco_purchasing_director_model.pkl')
 sco_scaler_path = os.path.join('app', 'models', 'sco_purchasing_director_scaler.pkl')
 
-sco_model = joblib.load(sco_model_path)
-sco_scaler = joblib.load(sco_scaler_path)
+model_registry.register('sco_model', lambda: joblib.load(sco_model_path), sco_model_path)
+model_registry.register('sco_scaler', lambda: joblib.load(sco_scaler_path), sco_scaler_path)
 
 
 def predict_dispute(invoice_data: dict):
+    sco_model = model_registry.get('sco_model')
+    sco_scaler = model_registry.get('sco_scaler')
     df = pd.DataFrame([invoice_data])
 
     numeric = ['Invoice_Amount', 'Invoice_VATRate', 'Product_Price', 'Delay_Invoice', 'Delay_Payment']
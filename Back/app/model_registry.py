@@ -0,0 +1,250 @@
+# app/model_registry.py
+
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+import joblib
+import numpy as np
+
+
+def resident_bytes():
+    # Resident set size of this process, or None where /proc is not available
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def mapped_bytes(value):
+    # Bytes of memory-mapped arrays inside an artifact; they live in the shared page cache
+    if isinstance(value, np.memmap):
+        return value.nbytes
+    if isinstance(value, tuple):
+        return sum(mapped_bytes(v) for v in value)
+    return 0
+
+
+class ModelRegistry:
+    """
+    Model artifacts loaded lazily: nothing is read at import time, each
+    artifact is loaded by its registered loader on first use (once, even under
+    concurrent requests) and its load time and memory footprint are recorded.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._depends_on = {}
+        self._unloads = 0
+        self._load_locks = {}
+        self._artifacts = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, loader, *paths, depends_on=()):
+        # `paths` are the files the loader reads, reported with their size on disk; a callable
+        # path returns the files current at the time, for artifacts stored as versions.
+        # `depends_on` names the artifacts the loader builds on; unloading one of them unloads this too
+        with self._lock:
+            self._loaders[name] = (loader, paths)
+            self._depends_on[name] = set(depends_on)
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        artifact = self._artifacts.get(name)
+        if artifact is not None:
+            return artifact
+        if name not in self._loaders:
+            raise KeyError(f"Unknown model artifact '{name}'")
+
+        with self._load_locks[name]:
+            artifact = self._artifacts.get(name)
+            if artifact is not None:
+                return artifact
+
+            loader, _ = self._loaders[name]
+            unloads = self._unloads
+            rss_before = resident_bytes()
+            start = time.perf_counter()
+            artifact = loader()
+            load_seconds = time.perf_counter() - start
+            rss_after = resident_bytes()
+
+            with self._lock:
+                # An unload during the load may have dropped what it was built from; serve it, don't keep it
+                if unloads != self._unloads:
+                    return artifact
+                self._artifacts[name] = artifact
+                self._stats[name] = {
+                    'load_seconds': round(load_seconds, 4),
+                    'resident_bytes': rss_after - rss_before if rss_before is not None else None,
+                    'mapped_bytes': mapped_bytes(artifact)
+                }
+            return artifact
+
+    def unload(self, name=None):
+        # Drop loaded artifacts so the next use reads them again, e.g. after retraining; artifacts
+        # registered as depending on a dropped one go too, so nothing stays built from the old files
+        with self._lock:
+            names = {name} if name is not None else set(self._artifacts)
+            while True:
+                dependents = {key for key, sources in self._depends_on.items() if sources & names} - names
+                if not dependents:
+                    break
+                names |= dependents
+            self._unloads += 1
+            for key in names:
+                self._artifacts.pop(key, None)
+                self._stats.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for name, (_, paths) in self._loaders.items():
+                paths = [p for entry in paths for p in (entry() if callable(entry) else (entry,))]
+                result[name] = {
+                    'loaded': name in self._artifacts,
+                    'file_bytes': sum(os.path.getsize(p) for p in paths if os.path.exists(p)),
+                    **self._stats.get(name, {})
+                }
+            return result
+
+
+model_registry = ModelRegistry()
+
+
+#! ------------------------------
+# Embeddings as memory-mapped .npy files, shared by every worker through the page cache.
+# Each save writes a new version directory (ids, raw matrix, unit-normalised matrix) next to the
+# pickle and then points current.json at it, so the three files are always swapped in together.
+# Saves hold an exclusive lock on the store, so concurrent writers (training, or several workers
+# deriving the files on their first load) run one after the other
+
+EMBEDDING_FILES = ('ids.npy', 'matrix.npy', 'unit.npy')
+
+
+def embedding_store(pickle_path):
+    return os.path.splitext(pickle_path)[0]
+
+
+@contextmanager
+def store_lock(store):
+    os.makedirs(store, exist_ok=True)
+    with open(os.path.join(store, 'write.lock'), 'a+b') as f:
+        f.seek(0)
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def current_embedding_version(pickle_path):
+    # Contents of current.json ({} before the first save)
+    try:
+        with open(os.path.join(embedding_store(pickle_path), 'current.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def embedding_matrix_paths(pickle_path):
+    # Files of the current version, or none before the first save
+    version = current_embedding_version(pickle_path).get('version')
+    if version is None:
+        return ()
+    return tuple(os.path.join(embedding_store(pickle_path), version, name) for name in EMBEDDING_FILES)
+
+
+def embedding_matrix_stale(pickle_path):
+    # True when the current version is missing any file, or was derived from an older pickle
+    current = current_embedding_version(pickle_path)
+    paths = embedding_matrix_paths(pickle_path)
+    if not paths or not all(os.path.exists(path) for path in paths):
+        return True
+    return os.path.exists(pickle_path) and os.path.getmtime(pickle_path) != current.get('source_mtime')
+
+
+def save_embedding_matrix(embeddings, pickle_path):
+    """
+    Write an {id: vector} embedding dict as float32 .npy matrices, raw and
+    with unit-length rows, plus an .npy of its ids (row order), as a new
+    version next to `pickle_path`. Called by training right after the pickle
+    is written; the API only derives the files when they are missing or stale.
+    """
+    with store_lock(embedding_store(pickle_path)):
+        _write_version(embeddings, pickle_path)
+
+
+def _write_version(embeddings, pickle_path):
+    # Caller holds store_lock
+    ids = [str(key) for key in embeddings]
+    matrix = np.array([embeddings[key] for key in embeddings], dtype=np.float32).reshape(len(ids), -1)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    unit = matrix / np.where(norms > 0, norms, 1)
+
+    store = embedding_store(pickle_path)
+    previous = current_embedding_version(pickle_path).get('version')
+    version = f'{time.time_ns()}-{os.getpid()}'
+    os.makedirs(os.path.join(store, version))
+    for name, value in zip(EMBEDDING_FILES, (np.array(ids, dtype=str), matrix, unit)):
+        np.save(os.path.join(store, version, name), value)
+
+    pointer = os.path.join(store, 'current.json')
+    with open(f'{pointer}.tmp', 'w') as f:
+        json.dump({
+            'version': version, 'rows': len(ids), 'dimensions': matrix.shape[1],
+            'source_mtime': os.path.getmtime(pickle_path) if os.path.exists(pickle_path) else None
+        }, f)
+    os.replace(f'{pointer}.tmp', pointer)
+
+    # The version before stays for readers that resolved it just before the swap; older ones go
+    if previous is not None:
+        for name in os.listdir(store):
+            if os.path.isdir(os.path.join(store, name)) and _version_time(name) < _version_time(previous):
+                shutil.rmtree(os.path.join(store, name), ignore_errors=True)
+
+
+def _version_time(version):
+    try:
+        return int(version.split('-')[0])
+    except ValueError:
+        return float('inf')
+
+
+def load_embedding_matrix(pickle_path):
+    """
+    (ids, matrix, unit) of an embedding artifact, with the raw and the
+    unit-normalised matrix memory-mapped read-only, all from the same
+    version. The files are derived from the pickle when they are missing or
+    older than it; a process that finds another one already did so under the
+    lock reuses its files.
+    """
+    if embedding_matrix_stale(pickle_path):
+        with store_lock(embedding_store(pickle_path)):
+            if embedding_matrix_stale(pickle_path):
+                _write_version(joblib.load(pickle_path), pickle_path)
+
+    ids_path, matrix_path, unit_path = embedding_matrix_paths(pickle_path)
+    return np.load(ids_path).tolist(), np.load(matrix_path, mmap_mode='r'), np.load(unit_path, mmap_mode='r')
@@ -0,0 +1,49 @@
+# app/pair_sampling.py
+
+import random
+
+import numpy as np
+
+
+def pair_count(n_items):
+    return n_items * (n_items - 1) // 2
+
+
+def unrank_pairs(ranks, n_items):
+    """
+    Map ranks in itertools.combinations(range(n_items), 2) order back to
+    their (i, j) index pairs, i < j, as two int64 arrays.
+    """
+    ranks = np.asarray(ranks, dtype=np.int64)
+    n = n_items
+
+    def first_rank(i):
+        # Rank of (i, i + 1), the first pair starting with i
+        return i * n - i * (i + 1) // 2
+
+    b = 2 * n - 1
+    i = np.floor((b - np.sqrt(b * b - 8.0 * ranks)) / 2).astype(np.int64)
+    # Float rounding can land one row off either way
+    i = np.clip(i, 0, max(n - 2, 0))
+    i -= first_rank(i) > ranks
+    i += (i < n - 2) & (first_rank(i + 1) <= ranks)
+    j = ranks - first_rank(i) + i + 1
+    return i, j
+
+
+def sample_index_pairs(n_items, n_pairs, rng=random):
+    """
+    Draw min(n_pairs, C(n_items, 2)) distinct unordered index pairs uniformly,
+    without building the list of all pairs. Returns (i, j) int64 arrays.
+    """
+    total = pair_count(n_items)
+    # random.sample over a range draws without materialising it
+    ranks = rng.sample(range(total), min(n_pairs, total))
+    return unrank_pairs(ranks, n_items)
+
+
+def pair_features(matrix, i, j):
+    """
+    Concatenated embeddings of every sampled pair, gathered in one go.
+    """
+    return np.hstack([matrix[i], matrix[j]])
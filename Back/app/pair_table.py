@@ -0,0 +1,180 @@
+# app/pair_table.py
+
+import argparse
+import datetime
+import heapq
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+import joblib
+import numpy as np
+
+from app.model_registry import load_embedding_matrix
+from app.pair_sampling import pair_count, pair_features, unrank_pairs
+
+# Bump when the table layout changes; older tables are then rejected
+PAIR_TABLE_VERSION = 1
+pair_table_path = os.path.join('app', 'models', 'product_pair_table.pkl')
+model_path = os.path.join('app', 'models', 'rf_model.pkl')
+embeddings_path = os.path.join('app', 'models', 'product_embeddings.pkl')
+
+
+def candidate_pairs(matrix, n_candidates, block_size=1024):
+    """
+    Prune the pair space to each product's `n_candidates` most cosine-similar
+    products. Returns the distinct (i, j) index pairs, i < j, as int64 arrays.
+    """
+    n = matrix.shape[0]
+    n_candidates = min(n_candidates, n - 1)
+    if n_candidates <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    unit = matrix / np.where(norms > 0, norms, 1)
+    keys = []
+    for start in range(0, n, block_size):
+        rows = np.arange(start, min(start + block_size, n))
+        similarity = unit[rows] @ unit.T
+        similarity[np.arange(rows.size), rows] = -np.inf
+        nearest = np.argpartition(-similarity, n_candidates - 1, axis=1)[:, :n_candidates]
+        first = np.repeat(rows, n_candidates)
+        second = nearest.ravel()
+        keys.append(np.minimum(first, second) * n + np.maximum(first, second))
+
+    keys = np.unique(np.concatenate(keys))
+    return keys // n, keys % n
+
+
+#! ------------------------------
+# Worker side: the model and embeddings are loaded once per process
+
+_worker = {}
+
+
+def _init_worker(model_file, matrix):
+    _worker['model'] = joblib.load(model_file)
+    _worker['matrix'] = matrix
+
+
+def _score_pairs(first, second, top_k):
+    # Score one block and keep only its own top_k, so little is sent back
+    scores = _worker['model'].predict_proba(pair_features(_worker['matrix'], first, second))[:, 1]
+    if scores.size > top_k:
+        keep = np.argpartition(-scores, top_k - 1)[:top_k]
+        scores, first, second = scores[keep], first[keep], second[keep]
+    return scores, first, second
+
+
+def _score_ranks(start, stop, n_items, top_k):
+    first, second = unrank_pairs(np.arange(start, stop), n_items)
+    return _score_pairs(first, second, top_k)
+
+
+def _merge_top(heap, futures, top_k):
+    # Push block results into the bounded min-heap, whose root is the weakest pair kept so far
+    for future in futures:
+        scores, first, second = future.result()
+        for item in zip(scores.tolist(), first.tolist(), second.tolist()):
+            if len(heap) < top_k:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+
+def build_pair_table(top_k=1000, n_candidates=100, workers=None, block_size=20000, path=pair_table_path):
+    """
+    Offline job: score product pairs with the RandomForest in vectorised
+    blocks across a process pool and persist the `top_k` best.
+
+    With `n_candidates` set, only pairs among each product's most similar
+    embeddings are scored; with None every pair is scored exhaustively.
+    """
+    product_ids, matrix, _ = load_embedding_matrix(embeddings_path)
+    n = len(product_ids)
+
+    workers = workers or os.cpu_count() or 1
+    if n_candidates is None:
+        total = pair_count(n)
+        blocks = ((_score_ranks, start, min(start + block_size, total), n, top_k)
+                  for start in range(0, total, block_size))
+    else:
+        first, second = candidate_pairs(matrix, n_candidates)
+        total = first.size
+        blocks = ((_score_pairs, first[start:start + block_size], second[start:start + block_size], top_k)
+                  for start in range(0, total, block_size))
+
+    heap = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model_path, matrix)) as pool:
+        # Only a few blocks per worker are in flight; each result is merged and dropped as it arrives,
+        # so the parent holds at most that many block top-K's, however many pairs there are
+        pending = set()
+        for block in blocks:
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                _merge_top(heap, done, top_k)
+            pending.add(pool.submit(*block))
+        _merge_top(heap, as_completed(pending), top_k)
+
+    ranked = sorted(heap, reverse=True)
+    table = {
+        'version': PAIR_TABLE_VERSION,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'mode': 'exhaustive' if n_candidates is None else 'candidates',
+        'n_candidates': n_candidates,
+        'products': n,
+        'pairs_scored': int(total),
+        'product1': [product_ids[i] for _, i, _ in ranked],
+        'product2': [product_ids[j] for _, _, j in ranked],
+        'scores': np.array([score for score, _, _ in ranked])
+    }
+
+    # Write next to the target and swap it in, so readers never see half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.tmp'
+    joblib.dump(table, tmp_path)
+    os.replace(tmp_path, path)
+    return table
+
+
+_table_cache = {}
+_table_lock = threading.Lock()
+
+
+def load_pair_table(path=pair_table_path):
+    """
+    Load the persisted pair table, reusing the in-memory copy until the file
+    on disk is replaced by a newer build.
+    """
+    try:
+        mtime = os.stat(path).st_mtime
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Product pair table not found at {path}. Build it with: python -m app.pair_table")
+
+    with _table_lock:
+        cached = _table_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            table = joblib.load(path)
+            # An outdated table is remembered too, so it is not reloaded on every request until rebuilt
+            cached = (mtime, table, table.get('version'))
+            _table_cache[path] = cached
+        if cached[2] != PAIR_TABLE_VERSION:
+            raise ValueError(
+                f"Product pair table at {path} is version {cached[2]}, "
+                f"expected {PAIR_TABLE_VERSION}. Rebuild it with: python -m app.pair_table"
+            )
+        return cached[1]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the precomputed top-K product pair table')
+    parser.add_argument('--top-k', type=int, default=1000)
+    parser.add_argument('--candidates', type=int, default=100,
+                        help='Most similar products paired with each product; ignored with --exhaustive')
+    parser.add_argument('--exhaustive', action='store_true', help='Score every product pair')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--block-size', type=int, default=20000)
+    args = parser.parse_args()
+
+    result = build_pair_table(top_k=args.top_k, n_candidates=None if args.exhaustive else args.candidates,
+                              workers=args.workers, block_size=args.block_size)
+    print(f"✅ Top {len(result['scores'])} of {result['pairs_scored']} scored product pairs saved to {pair_table_path}")
@@ -0,0 +1,114 @@
+# app/reference_data.py
+
+import os
+import threading
+import time
+
+
+class ReferenceData:
+    """
+    In-process cache of dimension-table lookups (product names, categories,
+    ...) shared by every request in the worker.
+
+    Each entry is loaded by its registered loader on first use and kept for
+    `ttl` seconds. Past that the cached value is still served while a single
+    background thread reloads it, so SQL Server is queried at most once per
+    refresh interval. A failed refresh keeps the previous value.
+    invalidate() drops entries so the next read reloads them.
+    """
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._loaders = {}
+        self._load_locks = {}
+        self._entries = {}
+        self._refreshing = set()
+        self._errors = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+
+    def register(self, name, loader):
+        with self._lock:
+            self._loaders[name] = loader
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        entry = self._entries.get(name)
+        if entry is None:
+            return self._load(name, only_if_missing=True)
+
+        loaded_at, value = entry
+        with self._lock:
+            self.hits += 1
+            stale = time.monotonic() - loaded_at >= self.ttl and name not in self._refreshing
+            if stale:
+                self._refreshing.add(name)
+        if stale:
+            threading.Thread(target=self._refresh, args=(name,), daemon=True).start()
+        return value
+
+    def _load(self, name, only_if_missing=False):
+        if name not in self._loaders:
+            raise KeyError(f"Unknown reference data '{name}'")
+        with self._load_locks[name]:
+            # Concurrent first reads wait for one load instead of each running the query
+            entry = self._entries.get(name)
+            if only_if_missing and entry is not None:
+                return entry[1]
+            value = self._loaders[name]()
+            with self._lock:
+                self._entries[name] = (time.monotonic(), value)
+                self._errors.pop(name, None)
+                self.loads += 1
+            return value
+
+    def _refresh(self, name):
+        try:
+            self._load(name)
+        except Exception as e:
+            with self._lock:
+                self._errors[name] = str(e)
+                # Keep serving the old value and retry after another interval
+                entry = self._entries.get(name)
+                if entry is not None:
+                    self._entries[name] = (time.monotonic(), entry[1])
+        finally:
+            with self._lock:
+                self._refreshing.discard(name)
+
+    def prefetch(self, *names):
+        # Start loading entries in the background (all registered ones if no names), e.g. at startup
+        for name in names or list(self._loaders):
+            with self._lock:
+                if name in self._entries or name in self._refreshing:
+                    continue
+                self._refreshing.add(name)
+            threading.Thread(target=self._refresh, args=(name,), daemon=True).start()
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'ttl': self.ttl,
+                'loads': self.loads,
+                'hits': self.hits,
+                'entries': {
+                    name: {
+                        'age_seconds': round(now - self._entries[name][0], 3) if name in self._entries else None,
+                        'refreshing': name in self._refreshing,
+                        'last_error': self._errors.get(name)
+                    }
+                    for name in self._loaders
+                }
+            }
+
+
+reference_data = ReferenceData(ttl=float(os.getenv('REFERENCE_DATA_TTL', 300)))
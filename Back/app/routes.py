@@ -3,11 +3,14 @@ from flasgger import swag_from
 import pandas as pd
 import pyodbc
 from app.ml_models import (
-    recommend_suppliers,
-    get_top_product_pairs, ask_llm, compute_var, forecast_stock, get_performance_for_stock, get_anomalies_for_stock,
+    recommend_suppliers, recommend_suppliers_batch,
+    get_top_product_pairs, get_product_pairs, ask_llm, compute_var, forecast_stock, get_performance_for_stock, get_anomalies_for_stock,
     predict_dispute
 )
-from app.layout_optimizer import generate_layout_template, optimize_layout
+from app.layout_optimizer import generate_layout_template, optimize_layout, optimize_layout_multistart
+from app.layout_codec import decode_grid, requested_encoding
+from app.layout_analytics import layout_metrics
+from app.layout_simulation import simulate_shoppers
 import jwt
 import datetime
 from flask import current_app as app
@@ -15,6 +18,8 @@ import os
 from dotenv import load_dotenv
 from flask_cors import cross_origin
 from app.aisles_recom import recommend_category_placement
+from app.reference_data import reference_data
+from app.model_registry import model_registry
 
 load_dotenv()
 
@@ -112,6 +117,74 @@ def recommend_suppliers_api():
     return jsonify({'recommendations': recommendations})
 
 
+@api_blueprint.route('/api/recommend_suppliers/batch', methods=['POST'])
+@swag_from({
+    'tags': ['Supplier Recommendation'],
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'categories': {
+                        'description': 'List of product categories, or "all" for every category',
+                        'example': ['Fruits', 'Dairy']
+                    },
+                    'n': {
+                        'type': 'integer',
+                        'description': 'Number of recommendations per category (default 5, capped at '
+                                       'MAX_SUPPLIER_RECOMMENDATIONS)'
+                    },
+                    'preferred_country': {
+                        'type': 'string',
+                        'description': 'Preferred country for suppliers (default France)'
+                    }
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Recommended suppliers keyed by category',
+            'examples': {
+                'application/json': {
+                    'recommendations': {
+                        'Fruits': [{'SupplierName': 'Agrum', 'Country': 'France', 'AvgSupplierPrice': 12.5,
+                                    'HasDisputes': 'No Disputes', 'NumberOfTransactions': 42}],
+                        'Unknown': {'message': 'No suppliers available for this category.'}
+                    }
+                }
+            }
+        },
+        400: {'description': 'categories not a list of names / "all", or n not a positive integer'}
+    }
+})
+def recommend_suppliers_batch_api():
+    data = request.get_json(silent=True) or {}
+    categories = data.get('categories', 'all')
+    if categories != 'all' and not (
+        isinstance(categories, list) and all(isinstance(category, str) for category in categories)
+    ):
+        return jsonify({'error': 'categories must be a list of category names or "all"'}), 400
+    try:
+        n = int(data.get('n', 5))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'n must be an integer'}), 400
+    if n < 1:
+        return jsonify({'error': 'n must be at least 1'}), 400
+    n = min(n, app.config['MAX_SUPPLIER_RECOMMENDATIONS'])
+    preferred_country = data.get('preferred_country', 'France')
+    if not isinstance(preferred_country, str):
+        return jsonify({'error': 'preferred_country must be a string'}), 400
+
+    recommendations = recommend_suppliers_batch(categories, n, preferred_country)
+
+    return jsonify({'recommendations': recommendations})
+
+
 #!  -------------------------------------------
 #? Product Recommendation API
 
@@ -149,6 +222,63 @@ def recommend_product_pairs_api():
     return jsonify({'top_product_pairs': top_pairs})
 
 
+@api_blueprint.route('/api/products/<product_id>/pairs', methods=['GET'])
+@swag_from({
+    'tags': ['Product Recommendation'],
+    'parameters': [
+        {'name': 'product_id', 'in': 'path', 'type': 'string', 'required': True},
+        {
+            'name': 'n',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'default': 10,
+            'description': 'Number of products to return (capped at MAX_PRODUCT_PAIRS)'
+        },
+        {
+            'name': 'candidates',
+            'in': 'query',
+            'type': 'integer',
+            'required': False,
+            'default': 50,
+            'description': 'Nearest products shortlisted by embedding similarity before re-ranking '
+                           '(capped at MAX_PAIR_CANDIDATES)'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Products often bought together with the given product, best first',
+            'examples': {
+                'application/json': {
+                    'product_id': '123',
+                    'product_name': 'Milk',
+                    'pairs': [
+                        {'product_id': '456', 'product_name': 'Cereal', 'score': 0.91, 'similarity': 0.83}
+                    ]
+                }
+            }
+        },
+        400: {'description': 'n or candidates is not a positive integer'},
+        404: {'description': 'Unknown product'}
+    }
+})
+def product_pairs_api(product_id):
+    try:
+        n_pairs = int(request.args.get('n', 10))
+        n_candidates = int(request.args.get('candidates', 50))
+    except ValueError:
+        return jsonify({'error': 'n and candidates must be integers'}), 400
+    if n_pairs < 1 or n_candidates < 1:
+        return jsonify({'error': 'n and candidates must be at least 1'}), 400
+    # Every candidate is scored by the RandomForest, so the shortlist is what a request costs
+    n_pairs = min(n_pairs, app.config['MAX_PRODUCT_PAIRS'])
+    n_candidates = min(n_candidates, app.config['MAX_PAIR_CANDIDATES'])
+    result = get_product_pairs(product_id, n_pairs, n_candidates)
+    if result is None:
+        return jsonify({'error': f'Unknown product {product_id}'}), 404
+    return jsonify(result)
+
+
 #!  -------------------------------------------
 #? Stock Market APIs
 
@@ -310,13 +440,18 @@ def predict_dispute_api():
     }
 })
 def get_categories():
+    return jsonify({'categories': reference_data.get('categories')})
+
+
+def load_categories():
     conn = get_db_connection()
     query = "SELECT DISTINCT BK_Category FROM DimCategory WHERE BK_Category IS NOT NULL"
     df = pd.read_sql(query, conn)
     conn.close()
+    return df['BK_Category'].dropna().unique().tolist()
+
 
-    categories = df['BK_Category'].dropna().unique().tolist()
-    return jsonify({'categories': categories})
+reference_data.register('categories', load_categories)
 
 
 #! -------------------------------------------
@@ -341,13 +476,105 @@ def get_categories():
     }
 })
 def get_stock_exchanges():
+    return jsonify({'stock_exchanges': reference_data.get('stock_exchanges')})
+
+
+def load_stock_exchanges():
     conn = get_db_connection()
     query = "SELECT DISTINCT BK_StockExchange FROM DimStockExchange WHERE BK_StockExchange IS NOT NULL"
     df = pd.read_sql(query, conn)
     conn.close()
+    return df['BK_StockExchange'].dropna().unique().tolist()
 
-    exchanges = df['BK_StockExchange'].dropna().unique().tolist()
-    return jsonify({'stock_exchanges': exchanges})
+
+reference_data.register('stock_exchanges', load_stock_exchanges)
+
+
+#! -------------------------------------------
+#? Model Artifacts
+
+@api_blueprint.route('/api/models', methods=['GET'])
+@swag_from({
+    'tags': ['Models'],
+    'responses': {
+        200: {
+            'description': 'Per-artifact load state, load time, resident and memory-mapped bytes, size on disk',
+            'examples': {
+                'application/json': {
+                    'rf_model': {'loaded': True, 'file_bytes': 1048576, 'load_seconds': 0.21,
+                                 'resident_bytes': 2097152, 'mapped_bytes': 0}
+                }
+            }
+        }
+    }
+})
+def model_stats_api():
+    return jsonify(model_registry.stats())
+
+
+@api_blueprint.route('/api/models/unload', methods=['POST'])
+@swag_from({
+    'tags': ['Models'],
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': False,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'name': {
+                        'type': 'string',
+                        'description': 'Artifact to drop, e.g. product_embeddings (and product_index, built from it); '
+                                       'all artifacts if omitted'
+                    }
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {'description': 'Artifact statistics after unloading; they are read again from disk on next use'}
+    }
+})
+def unload_models_api():
+    # After retraining or `training.py --incremental`, so requests pick up the new files
+    data = request.get_json(silent=True) or {}
+    model_registry.unload(data.get('name'))
+    return jsonify(model_registry.stats())
+
+
+#! -------------------------------------------
+#? Reference Data Cache
+
+@api_blueprint.route('/api/reference_data/invalidate', methods=['POST'])
+@swag_from({
+    'tags': ['Reference Data'],
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': False,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'name': {
+                        'type': 'string',
+                        'description': 'product_names, categories, stock_exchanges or supplier_index; all entries if omitted'
+                    }
+                }
+            }
+        }
+    ],
+    'responses': {
+        200: {'description': 'Cache statistics after dropping the entries; they are reloaded on next use'}
+    }
+})
+def invalidate_reference_data_api():
+    data = request.get_json(silent=True) or {}
+    reference_data.invalidate(data.get('name'))
+    return jsonify(reference_data.stats())
 
 
 #! -------------------------------------------
@@ -379,6 +606,15 @@ def get_stock_exchanges():
             'type': 'number',
             'required': True,
             'description': 'Size of one grid cell in meters'
+        },
+        {
+            'name': 'format',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['json', 'rle'],
+            'required': False,
+            'description': 'Grid encoding of the response: json (default) or rle, the compact run-length form. '
+                           'Can also be requested with Accept: application/vnd.monofosm.layout-rle+json'
         }
     ],
     'responses': {
@@ -403,7 +639,9 @@ def generate_layout_template_api():
     height = float(request.args.get('height'))
     cell_size = float(request.args.get('cell_size'))
 
-    layout = generate_layout_template(width, height, cell_size)
+    encoding = requested_encoding(request.args, request.headers.get('Accept'))
+
+    layout = generate_layout_template(width, height, cell_size, encoding)
     return jsonify(layout)
 
 
@@ -435,22 +673,43 @@ def generate_layout_template_api():
                                 'required': ['type', 'x', 'y']
                             }
                         }
-                    }
+                    },
+                    'starts': {'type': 'integer'},
+                    'time_budget': {'type': 'number'},
+                    'seed': {'type': 'integer'}
                 },
                 'required': ['grid']
             },
-            'description': 'The layout grid to be optimized'
+            'description': 'The layout grid to be optimized. Set starts > 1 to run that many seeded '
+                           'optimisations in parallel (within time_budget seconds, default 10) and get '
+                           'back the best-scored one (starts is capped at MAX_LAYOUT_STARTS, time_budget at '
+                           'MAX_LAYOUT_TIME_BUDGET). With a seed every start is run to completion, ignoring '
+                           'time_budget, so the result is reproducible and repeated requests are served from a '
+                           'cache. The grid may also be sent in the compact '
+                           'rle form: {encoding, legend, rows, cols, runs}'
+        },
+        {
+            'name': 'format',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['json', 'rle'],
+            'required': False,
+            'description': 'Grid encoding of the response: json (default) or rle, the compact run-length form. '
+                           'Can also be requested with Accept: application/vnd.monofosm.layout-rle+json'
         }
     ],
     'responses': {
         200: {
-            'description': 'Optimized layout grid',
+            'description': 'Optimized layout grid, plus its score and seed when starts > 1. unplaced_zones lists the '
+                           'zone types (Butcher, Spices, FruitsVeg) for which no valid cell was left; empty when '
+                           'every zone was placed',
             'examples': {
                 'application/json': {
                     'grid': [
                         [{'type': 'Door', 'x': 0, 'y': 0}, {'type': 'Cashier', 'x': 1, 'y': 0}],
                         [{'type': 'Walkway', 'x': 0, 'y': 1}, {'type': 'Aisle', 'x': 1, 'y': 1}]
-                    ]
+                    ],
+                    'unplaced_zones': []
                 }
             }
         },
@@ -469,10 +728,195 @@ def optimize_layout_api():
     if not grid:
         return jsonify({'error': 'Missing layout grid'}), 400
 
-    optimized = optimize_layout(grid, rows, cols, cell_size)
+    try:
+        starts = int(data.get('starts', 1))
+        time_budget = float(data.get('time_budget', 10.0))
+        seed = data.get('seed')
+        if seed is not None:
+            seed = int(seed)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'starts and seed must be integers and time_budget a number'}), 400
+    if starts < 1 or not 0 < time_budget < float('inf'):
+        return jsonify({'error': 'starts must be at least 1 and time_budget positive'}), 400
+    # Each start is a job in the shared process pool, so one request can only ask for so many
+    starts = min(starts, app.config['MAX_LAYOUT_STARTS'])
+    time_budget = min(time_budget, app.config['MAX_LAYOUT_TIME_BUDGET'])
+
+    encoding = requested_encoding(request.args, request.headers.get('Accept'))
+    try:
+        if starts > 1:
+            optimized = optimize_layout_multistart(
+                grid, rows, cols, cell_size, encoding,
+                starts=starts, time_budget=time_budget, seed=seed, workers=app.config['LAYOUT_OPTIMIZER_WORKERS']
+            )
+        else:
+            optimized = optimize_layout(grid, rows, cols, cell_size, encoding, seed=seed)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     return jsonify(optimized)
 
 
+@api_blueprint.route('/api/layout_metrics', methods=['POST'])
+@cross_origin()
+@swag_from({
+    'tags': ['Layout Optimization'],
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'grid': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'array',
+                            'items': {
+                                'type': 'object',
+                                'properties': {
+                                    'type': {'type': 'string'},
+                                    'x': {'type': 'integer'},
+                                    'y': {'type': 'integer'}
+                                },
+                                'required': ['type', 'x', 'y']
+                            }
+                        }
+                    }
+                },
+                'required': ['grid']
+            },
+            'description': 'The layout grid to analyse, verbose or in the compact rle form'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Shopper-path metrics: walking distance from the doors to each zone type, '
+                           'aisle exposure to walkable cells and walkway dead ends',
+            'examples': {
+                'application/json': {
+                    'metrics': {
+                        'walkable_cells': 51282,
+                        'max_door_distance': 648,
+                        'zones': {'Butcher': {'cells': 1, 'unreachable': 0, 'min_distance': 278, 'mean_distance': 278.0}},
+                        'aisle_cells': 48708,
+                        'average_aisle_exposure': 2.0,
+                        'dead_ends': 0
+                    }
+                }
+            }
+        },
+        400: {
+            'description': 'Invalid input or missing grid'
+        }
+    }
+})
+def layout_metrics_api():
+    data = request.get_json()
+    if not data or not data.get('grid'):
+        return jsonify({'error': 'Missing layout grid'}), 400
+
+    try:
+        grid = decode_grid(data['grid'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'metrics': layout_metrics(grid)})
+
+
+@api_blueprint.route('/api/simulate_shoppers', methods=['POST'])
+@cross_origin()
+@swag_from({
+    'tags': ['Layout Optimization'],
+    'consumes': ['application/json'],
+    'parameters': [
+        {
+            'name': 'body',
+            'in': 'body',
+            'required': True,
+            'schema': {
+                'type': 'object',
+                'properties': {
+                    'grid': {
+                        'type': 'array',
+                        'items': {
+                            'type': 'array',
+                            'items': {
+                                'type': 'object',
+                                'properties': {
+                                    'type': {'type': 'string'},
+                                    'x': {'type': 'integer'},
+                                    'y': {'type': 'integer'}
+                                },
+                                'required': ['type', 'x', 'y']
+                            }
+                        }
+                    },
+                    'shoppers': {'type': 'integer', 'default': 10000},
+                    'basket_size': {'type': 'integer', 'default': 5},
+                    'targets': {'type': 'integer', 'default': 128},
+                    'seed': {'type': 'integer'}
+                },
+                'required': ['grid']
+            },
+            'description': 'The layout grid to simulate, verbose or in the compact rle form. shoppers, '
+                           'basket_size and targets must be at least 1 and are capped at MAX_SIMULATED_SHOPPERS, '
+                           'MAX_BASKET_SIZE and MAX_SIMULATION_TARGETS. Baskets are an approximation: they are '
+                           'drawn from `targets` cells only (every zone cell, plus one random aisle cell standing '
+                           'for each equal slice of the aisles), so on large stores a higher value gives a heatmap '
+                           'that depends less on which cells were drawn, at one distance field per target'
+        }
+    ],
+    'responses': {
+        200: {
+            'description': 'Heatmap of cell visit counts (rows x cols) and simulation statistics',
+            'examples': {
+                'application/json': {
+                    'heatmap': [[50, 40, 8], [60, 68, 16]],
+                    'shoppers': 50,
+                    'unfinished_shoppers': 0,
+                    'skipped_targets': 0,
+                    'steps': 27,
+                    'mean_path_length': 18.88,
+                    'max_visits': 96
+                }
+            }
+        },
+        400: {
+            'description': 'Invalid input, missing grid, or a layout without doors or aisles'
+        }
+    }
+})
+def simulate_shoppers_api():
+    data = request.get_json()
+    if not data or not data.get('grid'):
+        return jsonify({'error': 'Missing layout grid'}), 400
+
+    try:
+        n_shoppers = int(data.get('shoppers', 10000))
+        basket_size = int(data.get('basket_size', 5))
+        max_targets = int(data.get('targets', 128))
+        seed = data.get('seed')
+        if seed is not None:
+            seed = int(seed)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'shoppers, basket_size, targets and seed must be integers'}), 400
+    if n_shoppers < 1 or basket_size < 1 or max_targets < 1:
+        return jsonify({'error': 'shoppers, basket_size and targets must be at least 1'}), 400
+    n_shoppers = min(n_shoppers, app.config['MAX_SIMULATED_SHOPPERS'])
+    basket_size = min(basket_size, app.config['MAX_BASKET_SIZE'])
+    max_targets = min(max_targets, app.config['MAX_SIMULATION_TARGETS'])
+
+    try:
+        grid = decode_grid(data['grid'])
+        result = simulate_shoppers(grid, n_shoppers, basket_size, max_targets=max_targets, seed=seed)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    result['heatmap'] = result['heatmap'].tolist()
+    return jsonify(result)
+
+
 @api_blueprint.route('/api/recommend_category_placement', methods=['POST'])
 @cross_origin()
 @swag_from({
@@ -503,10 +947,26 @@ def optimize_layout_api():
                     },
                     'rows': {'type': 'integer'},
                     'cols': {'type': 'integer'},
-                    'cell_size': {'type': 'number'}
+                    'cell_size': {'type': 'number'},
+                    'time_budget': {'type': 'number'},
+                    'seed': {'type': 'integer'}
                 },
                 'required': ['grid', 'rows', 'cols', 'cell_size']
             },
+            'description': 'The grid may also be sent in the compact rle form: {encoding, legend, rows, cols, runs}. '
+                           'Categories often bought together are placed on aisle cells a short walk apart; '
+                           'time_budget (seconds, default 1, capped at MAX_PLACEMENT_TIME_BUDGET) bounds that search; '
+                           'seed fixes its random moves, but how far it gets within the budget still depends on '
+                           'machine load.'
+        },
+        {
+            'name': 'format',
+            'in': 'query',
+            'type': 'string',
+            'enum': ['json', 'rle'],
+            'required': False,
+            'description': 'Grid encoding of the response: json (default) or rle, the compact run-length form. '
+                           'Can also be requested with Accept: application/vnd.monofosm.layout-rle+json'
         }
     ],
     'responses': {
@@ -522,7 +982,20 @@ def recommend_category_placement_api():
         return jsonify({'error': 'Missing grid data'}), 400
 
     try:
-        updated_grid = recommend_category_placement(data)
+        time_budget = float(data.get('time_budget', 1.0))
+        seed = data.get('seed')
+        if seed is not None:
+            seed = int(seed)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'seed must be an integer and time_budget a number'}), 400
+    if not 0 < time_budget < float('inf'):
+        return jsonify({'error': 'time_budget must be a positive, finite number of seconds'}), 400
+    # The local search runs until the budget is spent, so it is what holds the worker
+    time_budget = min(time_budget, app.config['MAX_PLACEMENT_TIME_BUDGET'])
+
+    encoding = requested_encoding(request.args, request.headers.get('Accept'))
+    try:
+        updated_grid = recommend_category_placement(data, encoding, time_budget=time_budget, seed=seed)
         return jsonify({'grid': updated_grid})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -0,0 +1,113 @@
+# app/supplier_index.py
+
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+from sklearn.preprocessing import MinMaxScaler
+
+SUPPLIER_FEATURES = ['AvgSupplierPrice', 'DisputeRate', 'NumberOfTransactions']
+
+
+class SupplierIndex:
+    """
+    Supplier recommendations served from memory: built once from the
+    load_supplier_data() frame, with the MinMax-scaled features, a fitted
+    NearestNeighbors index and the ready-made response rows of every
+    category, so a request is a single kneighbors query.
+
+    Categories are stored one after the other (rows starts[c] to
+    starts[c] + sizes[c] of `scaled` and `rows`), which lets
+    recommend_many answer any number of categories in one pass.
+    """
+
+    def __init__(self, suppliers):
+        # AvgSupplierPrice of a supplier's first row, as the per-row lookup in the frame returned
+        prices = suppliers.drop_duplicates('PK_Supplier').set_index('PK_Supplier')['AvgSupplierPrice']
+
+        self.positions, self.knn, scaled, self.rows = {}, [], [], []
+        for category, category_df in suppliers.dropna().groupby('Category', sort=False):
+            self.positions[category] = len(self.knn)
+            scaled.append(MinMaxScaler().fit_transform(category_df[SUPPLIER_FEATURES]))
+            self.knn.append(NearestNeighbors(metric='euclidean').fit(scaled[-1]))
+            self.rows += [
+                {
+                    'SupplierName': str(name),
+                    'Country': str(country),
+                    'AvgSupplierPrice': float(price),
+                    'HasDisputes': "Has Disputes" if float(dispute_rate) > 0 else "No Disputes",  # STR not BOOL!
+                    'NumberOfTransactions': int(transactions)
+                }
+                for name, country, price, dispute_rate, transactions in zip(
+                    category_df['SupplierName'], category_df['Country'],
+                    prices.loc[category_df['PK_Supplier']].to_numpy(),
+                    category_df['DisputeRate'], category_df['NumberOfTransactions']
+                )
+            ]
+
+        self.sizes = np.array([len(block) for block in scaled], dtype=np.int64)
+        self.starts = np.r_[0, np.cumsum(self.sizes)[:-1]].astype(np.int64)
+        self.scaled = np.vstack(scaled) if scaled else np.empty((0, len(SUPPLIER_FEATURES)))
+
+    @staticmethod
+    def _ranked(rows, preferred_country):
+        # Sort France suppliers first
+        return sorted(
+            (dict(row) for row in rows),
+            key=lambda x: (x['Country'] != preferred_country, x['AvgSupplierPrice'])
+        )
+
+    def recommend(self, category, n_recommendations=5, preferred_country='France'):
+        if category not in self.positions:
+            return {"message": "No suppliers available for this category."}
+
+        code = self.positions[category]
+        start, size = self.starts[code], self.sizes[code]
+        n_neighbors = min(n_recommendations + 1, size)
+        if n_neighbors <= 1:
+            return {"message": f"Not enough suppliers in category {category} for recommendations."}
+
+        random_supplier_index = start + np.random.randint(0, size)
+        _, indices = self.knn[code].kneighbors(
+            self.scaled[random_supplier_index:random_supplier_index + 1], n_neighbors=n_neighbors
+        )
+        return self._ranked((self.rows[start + pos] for pos in indices[0, 1:]), preferred_country)
+
+    def recommend_many(self, categories=None, n_recommendations=5, preferred_country='France'):
+        """
+        {category: recommendations} for every category in `categories` (all
+        of them when None), like recommend() per category but computed
+        together: one random supplier is drawn per category, and the
+        distances from it to the rest of its category are one array
+        operation over the stacked feature matrix.
+        """
+        categories = list(self.positions) if categories is None else list(dict.fromkeys(categories))
+        known = [category for category in categories if category in self.positions]
+        codes = np.array([self.positions[category] for category in known], dtype=np.int64)
+        starts, sizes = self.starts[codes], self.sizes[codes]
+        offsets = np.r_[0, np.cumsum(sizes)[:-1]].astype(np.int64)
+
+        # Every row of the requested categories, with the position of its category in `known`
+        group = np.repeat(np.arange(codes.size), sizes)
+        members = np.repeat(starts - offsets, sizes) + np.arange(group.size)
+        queries = starts + (np.random.random(codes.size) * sizes).astype(np.int64)
+
+        distances = np.linalg.norm(self.scaled[members] - self.scaled[queries[group]], axis=1)
+        # The drawn supplier is not a recommendation for itself
+        distances[members == queries[group]] = np.inf
+        # Nearest first within each category; categories stay in order, so rank = position - offset
+        order = np.lexsort((distances, group))
+        rank = np.arange(order.size) - offsets[group]
+        picked = order[rank < np.minimum(n_recommendations, sizes - 1)[group]]
+
+        neighbours = {category: [] for category in known}
+        for member, g in zip(members[picked].tolist(), group[picked].tolist()):
+            neighbours[known[g]].append(self.rows[member])
+
+        results = {}
+        for category in categories:
+            if category not in self.positions:
+                results[category] = {"message": "No suppliers available for this category."}
+            elif not neighbours[category]:
+                results[category] = {"message": f"Not enough suppliers in category {category} for recommendations."}
+            else:
+                results[category] = self._ranked(neighbours[category], preferred_country)
+        return results
@@ -0,0 +1,119 @@
+# app/walkway_connectivity.py
+
+from collections import deque
+
+# Clockwise ring of the 8 cells around a cell, starting north. Consecutive
+# entries are 4-adjacent to each other, which is what makes the local test work.
+RING_OFFSETS = [(0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)]
+SIDE_OFFSETS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+
+class WalkwayConnectivity:
+    """
+    Tracks the walkway network of a layout while walkway cells are converted
+    into something else, and answers whether a conversion would disconnect it.
+
+    Most cells are decided by looking only at their 3x3 neighbourhood. When that
+    is not enough, one search is grown from each walkway neighbour in lock-step
+    and searches are merged with a union-find as they meet, so the check stops
+    as soon as every neighbour is reached again, or as soon as the smaller side
+    of a split runs out of cells.
+    """
+
+    def __init__(self, walkway_mask):
+        self.rows, self.cols = walkway_mask.shape
+        # Nested lists index much faster than NumPy for the one-cell lookups below
+        self.open = walkway_mask.tolist()
+
+    def is_open(self, x, y):
+        return 0 <= x < self.cols and 0 <= y < self.rows and self.open[y][x]
+
+    def can_remove(self, x, y):
+        """
+        Return True if the walkway at (x, y) can be removed without splitting
+        the remaining walkways into several components.
+        """
+        starts = [(x + dx, y + dy) for dx, dy in SIDE_OFFSETS if self.is_open(x + dx, y + dy)]
+        if len(starts) <= 1:
+            return True
+        if self._ring_connected(x, y):
+            return True
+        return self._searches_meet(x, y, starts)
+
+    def remove(self, x, y):
+        self.open[y][x] = False
+
+    def try_remove(self, x, y):
+        if not self.can_remove(x, y):
+            return False
+        self.remove(x, y)
+        return True
+
+    def _ring_connected(self, x, y):
+        # The side neighbours stay connected if they all lie on a single run of
+        # open cells when walking around the ring.
+        ring = [self.is_open(x + dx, y + dy) for dx, dy in RING_OFFSETS]
+        if all(ring):
+            return True
+
+        # Start walking just after a closed cell so no run wraps around the end
+        start = ring.index(False) + 1
+        runs_with_side = 0
+        in_run = False
+        run_has_side = False
+        for step in range(len(RING_OFFSETS)):
+            i = (start + step) % len(RING_OFFSETS)
+            if ring[i]:
+                in_run = True
+                run_has_side = run_has_side or i % 2 == 0
+            elif in_run:
+                runs_with_side += run_has_side
+                in_run = False
+                run_has_side = False
+        if in_run:
+            runs_with_side += run_has_side
+        return runs_with_side <= 1
+
+    def _searches_meet(self, x, y, starts):
+        parent = list(range(len(starts)))
+
+        def find(label):
+            while parent[label] != label:
+                parent[label] = parent[parent[label]]
+                label = parent[label]
+            return label
+
+        owner = {(x, y): -1}
+        frontiers = []
+        for label, cell in enumerate(starts):
+            owner[cell] = label
+            frontiers.append(deque([cell]))
+        groups = len(starts)
+
+        while True:
+            for label in range(len(starts)):
+                if find(label) != label:
+                    continue
+                frontier = frontiers[label]
+                if not frontier:
+                    # This side was exhausted before meeting the others
+                    return False
+
+                cx, cy = frontier.popleft()
+                for dx, dy in SIDE_OFFSETS:
+                    nx, ny = cx + dx, cy + dy
+                    if not self.is_open(nx, ny):
+                        continue
+                    other = owner.get((nx, ny))
+                    if other is None:
+                        owner[(nx, ny)] = label
+                        frontier.append((nx, ny))
+                    elif other != -1:
+                        root = find(other)
+                        if root != label:
+                            parent[root] = label
+                            frontier.extend(frontiers[root])
+                            frontiers[root] = deque()
+                            groups -= 1
+                            if groups == 1:
+                                return True
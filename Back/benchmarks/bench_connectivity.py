@@ -0,0 +1,123 @@
+# benchmarks/bench_connectivity.py
+"""
+Compare place_aisles with incremental connectivity tracking against the
+previous approach of a full BFS after every converted cell.
+
+Run from the Back/ directory:
+
+    python -m benchmarks.bench_connectivity --sizes 20x20 40x40 80x80 200x300
+"""
+
+import argparse
+import copy
+import random
+import time
+from collections import deque
+
+from app.layout_grid import LayoutGrid
+from app.layout_optimizer import generate_layout_template, place_aisles
+
+
+def neighbours_in_bounds(x, y, rows, cols):
+    return [
+        (nx, ny) for nx, ny in [(x - 1, y), (x + 1, y), (x, y - 1), (x, y + 1)]
+        if 0 <= nx < cols and 0 <= ny < rows
+    ]
+
+
+def is_walkway_connected_bfs(layout, rows, cols):
+    walkways = [(x, y) for y in range(rows) for x in range(cols) if layout[y][x]['type'] == 'Walkway']
+    if not walkways:
+        return True
+    visited = {walkways[0]}
+    queue = deque([walkways[0]])
+    while queue:
+        x, y = queue.popleft()
+        for nx, ny in neighbours_in_bounds(x, y, rows, cols):
+            if layout[ny][nx]['type'] == 'Walkway' and (nx, ny) not in visited:
+                visited.add((nx, ny))
+                queue.append((nx, ny))
+    return len(visited) == len(walkways)
+
+
+def place_aisles_bfs(layout, rows, cols):
+    # Previous implementation on the JSON grid, kept here as the baseline
+    row_walkways = {y: None for y in range(1, rows - 1)}
+    col_walkways = {x: None for x in range(1, cols - 1)}
+    for y in range(1, rows - 2):
+        for x in range(1, cols - 2):
+            if layout[y][x]['type'] == 'Walkway':
+                if row_walkways[y] is None:
+                    row_walkways[y] = (x, y)
+                if col_walkways[x] is None:
+                    col_walkways[x] = (x, y)
+    reserved = set(row_walkways.values()) | set(col_walkways.values())
+
+    candidates = []
+    blocked = set()
+    for x in range(1, cols - 2):
+        for y in range(1, rows - 2):
+            if (x, y) in blocked:
+                continue
+            if layout[y][x]['type'] == 'Walkway' and (x, y) not in reserved:
+                if any(layout[ny][nx]['type'] == 'Walkway' for nx, ny in neighbours_in_bounds(x, y, rows, cols)):
+                    candidates.append((x, y))
+                    blocked.add((x, y + 1))
+
+    for x, y in candidates:
+        layout[y][x]['type'] = 'Aisle'
+        if not is_walkway_connected_bfs(layout, rows, cols):
+            layout[y][x]['type'] = 'Walkway'
+
+
+def synthetic_layout(rows, cols, obstacle_ratio, seed):
+    template = generate_layout_template(cols, rows, 1)
+    layout = template['grid']
+    rng = random.Random(seed)
+    for y in range(1, rows - 1):
+        for x in range(1, cols - 1):
+            if rng.random() < obstacle_ratio:
+                layout[y][x]['type'] = 'Empty'
+    return layout
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def parse_size(text):
+    rows, cols = text.lower().split('x')
+    return int(rows), int(cols)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=['20x20', '40x40', '60x60', '100x100', '200x300'])
+    parser.add_argument('--obstacles', type=float, default=0.0, help='Fraction of interior cells blocked')
+    parser.add_argument('--max-bfs-cells', type=int, default=5000,
+                        help='Skip the BFS baseline above this many cells (it is quadratic)')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'size':>10} {'cells':>8} {'incremental (s)':>16} {'bfs (s)':>10} {'speedup':>8}")
+    for rows, cols in map(parse_size, args.sizes):
+        layout = synthetic_layout(rows, cols, args.obstacles, args.seed)
+        grid = LayoutGrid.from_json(layout)
+        fast = timed(place_aisles, grid)
+
+        if rows * cols <= args.max_bfs_cells:
+            slow_layout = copy.deepcopy(layout)
+            slow = timed(place_aisles_bfs, slow_layout, rows, cols)
+            if slow_layout != grid.to_json():
+                raise AssertionError(f'Layouts differ for {rows}x{cols}')
+            slow_text, speedup_text = f'{slow:10.3f}', f'{slow / fast:7.1f}x'
+        else:
+            slow_text, speedup_text = f"{'skipped':>10}", f"{'-':>8}"
+
+        print(f'{rows:>4}x{cols:<5} {rows * cols:>8} {fast:16.3f} {slow_text} {speedup_text}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/bench_copurchase.py
+"""
+Compare category co-purchase counting with a sparse incidence product
+(aisles_recom.category_cooccurrence) against the previous per-customer
+itertools.combinations loop, on synthetic sales rows.
+
+Run from the Back/ directory:
+
+    python -m benchmarks.bench_copurchase --rows 100000 1000000 5000000
+"""
+
+import argparse
+import itertools
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from app.aisles_recom import category_cooccurrence
+
+
+def synthetic_sales(n_rows, n_customers, n_categories, seed):
+    rng = np.random.default_rng(seed)
+    # Skewed category popularity, like real baskets
+    popularity = 1.0 / np.arange(1, n_categories + 1)
+    popularity /= popularity.sum()
+    return pd.DataFrame({
+        'CustomerID': rng.integers(0, n_customers, n_rows),
+        'ProductID': rng.integers(0, 50000, n_rows),
+        'BK_Category': np.array([f'Category {i:03d}' for i in range(n_categories)])[
+            rng.choice(n_categories, n_rows, p=popularity)
+        ]
+    })
+
+
+def pairs_loop(df):
+    # Previous implementation, kept here as the baseline
+    category_pairs = defaultdict(int)
+    grouped = df.groupby('CustomerID')['BK_Category'].apply(set)
+    for cats in grouped:
+        for c1, c2 in itertools.combinations(sorted(cats), 2):
+            category_pairs[(c1, c2)] += 1
+    return dict(category_pairs)
+
+
+def pairs_sparse(df):
+    categories, cooccurrence = category_cooccurrence(df)
+    pairs = sparse.triu(cooccurrence, k=1).tocoo()
+    return {(categories[i], categories[j]): int(w) for i, j, w in zip(pairs.row, pairs.col, pairs.data)}
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', nargs='+', type=int, default=[100_000, 1_000_000, 3_000_000])
+    parser.add_argument('--customers-per-row', type=float, default=0.1,
+                        help='Distinct customers as a fraction of sales rows')
+    parser.add_argument('--categories', type=int, default=60)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'customers':>10} {'loop (s)':>10} {'sparse (s)':>11} {'speedup':>8}")
+    for n_rows in args.rows:
+        n_customers = max(1, int(n_rows * args.customers_per_row))
+        df = synthetic_sales(n_rows, n_customers, args.categories, args.seed)
+
+        slow, slow_seconds = timed(pairs_loop, df)
+        fast, fast_seconds = timed(pairs_sparse, df)
+        if slow != fast:
+            raise AssertionError(f'Pair counts differ for {n_rows} rows')
+
+        print(f'{n_rows:>10} {n_customers:>10} {slow_seconds:10.2f} {fast_seconds:11.3f} '
+              f'{slow_seconds / fast_seconds:7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_embedding_index.py
+"""
+Latency and recall@k of the EmbeddingIndex modes behind
+/api/products/<id>/pairs: exact search against ivf at several n_probe
+settings (the default one marked with *). Recall is the share of the exact
+k nearest neighbours an ivf query returns.
+
+Uses app/models/product_embeddings.pkl when present, plus synthetic 64-d
+embeddings, unclustered (the hard case for ivf) and clustered.
+
+Run from the Back/ directory:
+
+    python -m benchmarks.bench_embedding_index
+    python -m benchmarks.bench_embedding_index --products 100000 --probes 8 32 128
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from app.embedding_index import EXACT_MODE, IVF_MODE, EmbeddingIndex
+from app.model_registry import load_embedding_matrix
+
+embeddings_path = os.path.join('app', 'models', 'product_embeddings.pkl')
+
+
+def datasets(products, dimensions, rng):
+    if os.path.exists(embeddings_path):
+        yield 'app/models', np.asarray(load_embedding_matrix(embeddings_path)[1])
+    yield 'unclustered', rng.standard_normal((products, dimensions)).astype(np.float32)
+    centres = rng.standard_normal((max(1, products // 100), dimensions))
+    noise = 0.3 * rng.standard_normal((products, dimensions))
+    yield 'clustered', (centres[rng.integers(0, len(centres), products)] + noise).astype(np.float32)
+
+
+def run(index, rows, k):
+    results, seconds = [], []
+    for row in rows:
+        start = time.perf_counter()
+        results.append(index.neighbours(row, k)[0])
+        seconds.append(time.perf_counter() - start)
+    return results, np.percentile(seconds, 50) * 1e3, np.percentile(seconds, 99) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=40000)
+    parser.add_argument('--dimensions', type=int, default=64)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=50, help='Neighbours per query (the pairs shortlist)')
+    parser.add_argument('--probes', nargs='+', type=int, default=[8, 16, 32, 64],
+                        help='ivf n_probe values to compare with the default')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'data':>12} {'mode':>6} {'lists':>6} {'probe':>6} {'p50 (ms)':>9} {'p99 (ms)':>9} {'recall':>7}")
+    for name, matrix in datasets(args.products, args.dimensions, rng):
+        rows = rng.integers(0, len(matrix), args.queries)
+        exact = EmbeddingIndex(matrix, mode=EXACT_MODE)
+        truth, p50, p99 = run(exact, rows, args.k)
+        print(f'{name:>12} {EXACT_MODE:>6} {"":>6} {"":>6} {p50:9.3f} {p99:9.3f} {1.0:7.3f}')
+
+        default = EmbeddingIndex(matrix, mode=IVF_MODE, seed=args.seed)
+        for n_probe in sorted({min(p, default.n_lists) for p in args.probes} | {default.n_probe}):
+            index = EmbeddingIndex(matrix, mode=IVF_MODE, n_probe=n_probe, seed=args.seed)
+            found, p50, p99 = run(index, rows, args.k)
+            recall = np.mean([
+                np.intersect1d(a, b).size / max(1, b.size) for a, b in zip(found, truth)
+            ])
+            marker = '*' if n_probe == default.n_probe else ''
+            print(f'{name:>12} {IVF_MODE:>6} {index.n_lists:>6} {f"{index.n_probe}{marker}":>6} '
+                  f'{p50:9.3f} {p99:9.3f} {recall:7.3f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# benchmarks/bench_forest.py
+"""
+Compare CompiledForest.predict_proba (forest_inference) against sklearn's
+RandomForestClassifier.predict_proba on product pair features: one large
+batch (1M pairs by default) plus request-sized batches, checking that the
+probabilities match exactly.
+
+Uses app/models/rf_model.pkl and product_embeddings.pkl when present,
+otherwise a forest trained on synthetic 64-d embeddings.
+
+Run from the Back/ directory:
+
+    python -m benchmarks.bench_forest
+    python -m benchmarks.bench_forest --pairs 200000 --workers 4 --batches 1 50 500
+"""
+
+import argparse
+import os
+import time
+
+import joblib
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+
+from app.forest_inference import CompiledForest
+from app.model_registry import load_embedding_matrix
+
+model_path = os.path.join('app', 'models', 'rf_model.pkl')
+embeddings_path = os.path.join('app', 'models', 'product_embeddings.pkl')
+
+
+def load_inputs(trees, seed):
+    if os.path.exists(model_path) and os.path.exists(embeddings_path):
+        _, matrix, _ = load_embedding_matrix(embeddings_path)
+        return joblib.load(model_path), np.asarray(matrix), 'app/models'
+
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((5000, 64)).astype(np.float32)
+    first, second = rng.integers(0, len(matrix), (2, 20000))
+    X = np.hstack([matrix[first], matrix[second]])
+    y = (X[:, :64] * X[:, 64:]).sum(axis=1) > 0
+    forest = RandomForestClassifier(n_estimators=trees, random_state=seed).fit(X, y)
+    return forest, matrix, 'synthetic'
+
+
+def timed(fn, X, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(X)
+    return result, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pairs', type=int, default=1_000_000)
+    parser.add_argument('--batches', nargs='+', type=int, default=[1, 50, 500, 5000])
+    parser.add_argument('--workers', type=int, default=1, help='Threads for the compiled forest')
+    parser.add_argument('--trees', type=int, default=100, help='Trees of the synthetic forest')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    forest, matrix, source = load_inputs(args.trees, args.seed)
+    start = time.perf_counter()
+    compiled = CompiledForest.from_sklearn(forest)
+    print(f'Forest from {source}: {len(forest.estimators_)} trees, {compiled.feature.size} nodes, '
+          f'compiled in {time.perf_counter() - start:.3f}s')
+
+    rng = np.random.default_rng(args.seed)
+    first, second = rng.integers(0, len(matrix), (2, args.pairs))
+    X = np.hstack([matrix[first], matrix[second]])
+
+    print(f"{'rows':>9} {'sklearn (ms)':>13} {'compiled (ms)':>14} {'speedup':>8} {'max |diff|':>11}")
+    for rows in args.batches + [args.pairs]:
+        batch = X[:rows]
+        repeat = max(1, 2000 // rows)
+        expected, sk_seconds = timed(forest.predict_proba, batch, repeat)
+        actual, compiled_seconds = timed(lambda b: compiled.predict_proba(b, workers=args.workers), batch, repeat)
+        diff = float(np.abs(expected - actual).max())
+        if diff:
+            raise AssertionError(f'Probabilities differ by {diff} on {rows} rows')
+        print(f'{rows:>9} {sk_seconds * 1e3:13.2f} {compiled_seconds * 1e3:14.2f} '
+              f'{sk_seconds / compiled_seconds:7.1f}x {diff:11.1e}')
+
+
+if __name__ == '__main__':
+    main()
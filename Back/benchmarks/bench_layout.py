@@ -0,0 +1,215 @@
+# benchmarks/bench_layout.py
+"""
+Benchmark the layout engine stage by stage on synthetic stores, without a
+database. Every case starts from generate_layout_template, adds doors on the
+outer wall and rectangular obstacles, then times each optimiser stage and
+records its peak memory. Results are written as JSON; pass --baseline with an
+earlier results file to fail on regressions.
+
+Run from the Back/ directory:
+
+    python -m benchmarks.bench_layout
+    python -m benchmarks.bench_layout --sizes 20x20 100x100 --doors 1 4 --obstacles 0 0.1
+    python -m benchmarks.bench_layout --baseline benchmarks/results/layout.json --output /tmp/layout.json
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.layout_analytics import layout_metrics
+from app.layout_codec import JSON_ENCODING, RLE_ENCODING, decode_grid, encode_grid
+from app.layout_optimizer import (
+    LAYOUT_ALGORITHM_VERSION, generate_layout_template, is_walkway_connected, optimize_steps
+)
+from app.layout_scoring import score_layout
+
+DEFAULT_SIZES = ['20x20', '50x50', '100x100', '200x200', '300x300', '500x500']
+
+
+def synthetic_layout(rows, cols, doors, obstacle_ratio, seed):
+    """
+    Template grid with `doors` doors spread along the outer wall and
+    rectangular 'Empty' blocks covering about `obstacle_ratio` of the floor.
+    """
+    layout = generate_layout_template(cols, rows, 1)['grid']
+    rng = random.Random(seed)
+
+    perimeter = [(x, 0) for x in range(cols)] + [(cols - 1, y) for y in range(1, rows)] + \
+                [(x, rows - 1) for x in range(cols - 2, -1, -1)] + [(0, y) for y in range(rows - 2, 0, -1)]
+    for i in range(doors):
+        x, y = perimeter[i * len(perimeter) // doors]
+        layout[y][x]['type'] = 'Door'
+
+    target = int(obstacle_ratio * rows * cols)
+    covered = 0
+    while covered < target and rows > 6 and cols > 6:
+        h = rng.randint(1, max(1, rows // 10))
+        w = rng.randint(1, max(1, cols // 10))
+        top = rng.randint(2, rows - 3 - h)
+        left = rng.randint(2, cols - 3 - w)
+        for y in range(top, top + h):
+            for x in range(left, left + w):
+                if layout[y][x]['type'] == 'Walkway':
+                    layout[y][x]['type'] = 'Empty'
+                    covered += 1
+    return layout
+
+
+def pipeline(layout, seed, state):
+    """
+    Run the optimiser pipeline once, yielding each stage's name as soon as it
+    is done. The optimisation stages come straight from optimize_steps, the
+    generator behind optimize_grid; decoding, encoding and scoring wrap them
+    as in optimize_layout.
+    """
+    grid = state['grid'] = decode_grid(layout)
+    yield 'decode_json'
+    for name in optimize_steps(grid, random.Random(seed)):
+        yield name
+        if name == 'ensure_walkways':
+            state['connected'] = is_walkway_connected(grid)
+            yield 'is_walkway_connected'
+    encode_grid(grid, JSON_ENCODING)
+    yield 'encode_json'
+    encode_grid(grid, RLE_ENCODING)
+    yield 'encode_rle'
+    state['score'] = score_layout(grid)
+    yield 'score_layout'
+    layout_metrics(grid)
+    yield 'layout_metrics'
+
+
+def run_case(layout, seed, repeat):
+    timings = {}
+    for _ in range(repeat):
+        state = {}
+        start = time.perf_counter()
+        for name in pipeline(layout, seed, state):
+            elapsed = time.perf_counter() - start
+            timings[name] = min(timings.get(name, elapsed), elapsed)
+            start = time.perf_counter()
+
+    # Memory is measured in a separate pass since tracing slows everything down
+    peaks = {}
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    for name in pipeline(layout, seed, {}):
+        peaks[name] = tracemalloc.get_traced_memory()[1] - base
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return timings, peaks, state
+
+
+def parse_size(text):
+    rows, cols = text.lower().split('x')
+    return int(rows), int(cols)
+
+
+def case_key(case):
+    return case['rows'], case['cols'], case['doors'], case['obstacles']
+
+
+def find_regressions(results, baseline, tolerance, min_seconds):
+    previous = {case_key(case): case for case in baseline['cases']}
+    regressions = []
+    for case in results['cases']:
+        old = previous.get(case_key(case))
+        if old is None:
+            continue
+        for stage, seconds in case['seconds'].items():
+            before = old['seconds'].get(stage)
+            if before is not None and seconds > before * tolerance and seconds - before > min_seconds:
+                regressions.append(
+                    f"{case['rows']}x{case['cols']} doors={case['doors']} obstacles={case['obstacles']} "
+                    f"{stage}: {before:.4f}s -> {seconds:.4f}s"
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, help='Grid sizes as ROWSxCOLS')
+    parser.add_argument('--doors', nargs='+', type=int, default=[1, 4])
+    parser.add_argument('--obstacles', nargs='+', type=float, default=[0.0, 0.1],
+                        help='Fractions of the floor covered by obstacles')
+    parser.add_argument('--repeat', type=int, default=3, help='Timing runs per case; the fastest is kept')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=os.path.join('benchmarks', 'results', 'layout.json'))
+    parser.add_argument('--baseline', help='Earlier results file to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Flag stages slower than baseline by more than this factor')
+    parser.add_argument('--min-seconds', type=float, default=0.005,
+                        help='Ignore slowdowns smaller than this many seconds')
+    args = parser.parse_args()
+
+    # Read the baseline up front: writing the results first would replace it when both are the same file
+    baseline = None
+    if args.baseline:
+        if os.path.abspath(args.output) == os.path.abspath(args.baseline):
+            parser.error('--output is the --baseline file and would overwrite it; pass a different --output')
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results = {
+        'benchmark': 'layout',
+        'algorithm_version': LAYOUT_ALGORITHM_VERSION,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cases': []
+    }
+
+    print(f"{'case':<32} {'total (s)':>10} {'peak MB':>8}  slowest stage")
+    for rows, cols in map(parse_size, args.sizes):
+        for doors in args.doors:
+            for obstacles in args.obstacles:
+                layout = synthetic_layout(rows, cols, doors, obstacles, args.seed)
+                timings, peaks, state = run_case(layout, args.seed, args.repeat)
+                case = {
+                    'rows': rows,
+                    'cols': cols,
+                    'cells': rows * cols,
+                    'doors': doors,
+                    'obstacles': obstacles,
+                    'walkways_connected': state['connected'],
+                    'score': state['score']['score'],
+                    'seconds': timings,
+                    'total_seconds': sum(timings.values()),
+                    'peak_memory_bytes': peaks,
+                    'max_peak_memory_bytes': max(peaks.values())
+                }
+                results['cases'].append(case)
+
+                slowest = max(timings, key=timings.get)
+                label = f'{rows}x{cols} doors={doors} obstacles={obstacles}'
+                print(f"{label:<32} {case['total_seconds']:10.3f} {case['max_peak_memory_bytes'] / 2 ** 20:8.1f}  "
+                      f"{slowest} ({timings[slowest]:.3f}s)")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {args.output}')
+
+    if baseline is not None:
+        regressions = find_regressions(results, baseline, args.tolerance, args.min_seconds)
+        for line in regressions:
+            print(f'REGRESSION {line}')
+        if regressions:
+            sys.exit(1)
+        print('No regressions against baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/bench_pair_sampling.py
+"""
+Compare the product pair sampler used by get_top_product_pairs
+(pair_sampling.sample_index_pairs + one gather) against the previous
+approach of listing every itertools.combinations pair and building each
+feature row with np.concatenate. Reports latency and peak traced memory on
+synthetic 64-d embeddings.
+
+Run from the Back/ directory:
+
+    python -m benchmarks.bench_pair_sampling --products 1000 4000 40000
+"""
+
+import argparse
+import itertools
+import random
+import time
+import tracemalloc
+
+import numpy as np
+
+from app.pair_sampling import pair_features, sample_index_pairs
+
+
+def legacy_sample(embeddings, n_pairs):
+    # Previous implementation, kept here as the baseline
+    products = list(embeddings.keys())
+    possible_pairs = list(itertools.combinations(products, 2))
+    sampled_pairs = random.sample(possible_pairs, min(n_pairs, len(possible_pairs)))
+    return np.array([np.concatenate([embeddings[a], embeddings[b]]) for a, b in sampled_pairs])
+
+
+def streaming_sample(ids, matrix, n_pairs):
+    first, second = sample_index_pairs(len(ids), n_pairs)
+    return pair_features(matrix, first, second)
+
+
+def measure(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', nargs='+', type=int, default=[1000, 2000, 4000, 40000])
+    parser.add_argument('--pairs', type=int, default=500)
+    parser.add_argument('--dimensions', type=int, default=64)
+    parser.add_argument('--legacy-max', type=int, default=4000,
+                        help='Skip the quadratic baseline above this many products')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+
+    print(f"{'products':>9} {'legacy (s)':>11} {'legacy MB':>10} {'stream (s)':>11} {'stream MB':>10}")
+    for n_products in args.products:
+        ids = [str(i) for i in range(n_products)]
+        matrix = rng.standard_normal((n_products, args.dimensions)).astype(np.float32)
+        embeddings = dict(zip(ids, matrix))
+
+        fast_seconds, fast_peak = measure(streaming_sample, ids, matrix, args.pairs)
+        if n_products <= args.legacy_max:
+            slow_seconds, slow_peak = measure(legacy_sample, embeddings, args.pairs)
+            legacy = f'{slow_seconds:11.3f} {slow_peak / 2 ** 20:10.1f}'
+        else:
+            legacy = f"{'skipped':>11} {'':>10}"
+        print(f'{n_products:>9} {legacy} {fast_seconds:11.4f} {fast_peak / 2 ** 20:10.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -2,13 +2,36 @@ import pyodbc
 import pandas as pd
 import numpy as np
 import networkx as nx
-import itertools
-import random
-from sklearn.ensemble import RandomForestClassifier
+import argparse
+import time
+from contextlib import contextmanager
 from node2vec import Node2Vec
+from gensim.models import Word2Vec
 import joblib
 import os
 
+from app.copurchase_state import update_copurchase_state
+from app.model_registry import save_embedding_matrix
+from training_data import (
+    NegativeSampler, PairReservoir, fit_forest_on_shards, positive_pair_blocks, uniform_random_walks,
+    write_feature_shards
+)
+from training_stages import StageCache, atomic_dump, frame_digest
+
+# Working files of the training job (stage checkpoints, feature shards); not served by the API
+cache_directory = 'training_cache'
+# Stage -> the stages it reads from
+STAGE_INPUTS = {
+    'graph': (), 'walks': ('graph',), 'embeddings': ('walks',),
+    'pairs': (), 'features': ('pairs', 'embeddings'), 'classifier': ('features',)
+}
+walk_params = {'dimensions': 64, 'walk_length': 10, 'num_walks': 50}
+embedding_params = {'window': 5, 'min_count': 1}
+
+embeddings_path = os.path.join('app', 'models', 'product_embeddings.pkl')
+# Word2Vec model plus the customer/product edges it was trained on, for incremental updates
+embedding_model_path = os.path.join('app', 'models', 'product_embedding_model.pkl')
+
 
 def get_db_connection():
     server = 'localhost'
@@ -19,63 +42,214 @@ def get_db_connection():
     return conn
 
 
-def train_and_save_models():
-    conn = get_db_connection()
-    query = """
-    SELECT 
-        F.CustomerID,
-        F.ProductID
-    FROM Fact_SalesPerformance F
-    WHERE F.CustomerID IS NOT NULL
-    AND F.ProductID IS NOT NULL
-    AND F.SalesTransactions_Amount IS NOT NULL
-    """
-    df = pd.read_sql(query, conn)
+@contextmanager
+def stage(name, timings):
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+    print(f"⏱️  {name}: {timings[name]:.2f}s")
 
+
+def build_graph(df):
     # Build bipartite graph
     B = nx.Graph()
-    customers = df['CustomerID'].astype(str).unique()
-    products = df['ProductID'].astype(str).unique()
-
-    B.add_nodes_from(customers, bipartite=0)
-    B.add_nodes_from(products, bipartite=1)
-    edges = list(df.apply(lambda row: (str(row['CustomerID']), str(row['ProductID'])), axis=1))
-    B.add_edges_from(edges)
-
-    # Train Node2Vec
-    node2vec = Node2Vec(B, dimensions=64, walk_length=10, num_walks=50, workers=1)
-    model = node2vec.fit(window=5, min_count=1, batch_words=4)
-
-    product_embeddings = {node: model.wv[node] for node in products}
-
-    # Positive and Negative pairs
-    positive_pairs_series = df.groupby('CustomerID')['ProductID'].apply(
-        lambda x: list(itertools.combinations(set(x.astype(str)), 2))
-    )
-    positive_pairs = [pair for sublist in positive_pairs_series for pair in sublist]
+    B.add_nodes_from(df['CustomerID'].unique().tolist(), bipartite=0)
+    B.add_nodes_from(df['ProductID'].unique().tolist(), bipartite=1)
+    B.add_edges_from(zip(df['CustomerID'].tolist(), df['ProductID'].tolist()))
+    return B
 
-    possible_negative_pairs = list(itertools.combinations(products, 2))
-    num_neg_samples = min(len(possible_negative_pairs), len(positive_pairs))
-    negative_pairs = random.sample(possible_negative_pairs, num_neg_samples)
-    positive_pairs = positive_pairs[:num_neg_samples]
 
-    def pair_embedding(pair):
-        return np.concatenate([product_embeddings[pair[0]], product_embeddings[pair[1]]])
+def generate_walks(B, workers=1, seed=None):
+    # Walks are generated in `workers` processes
+    return Node2Vec(B, workers=workers, seed=seed, quiet=True, **walk_params).walks
 
-    X = np.array([pair_embedding(p) for p in positive_pairs + negative_pairs])
-    y = np.array([1] * num_neg_samples + [0] * num_neg_samples)
 
-    # Train RandomForest
-    rf_clf = RandomForestClassifier()
-    rf_clf.fit(X, y)
+def fit_embeddings(walks, workers=1):
+    # Same skip-gram settings as Node2Vec.fit
+    return Word2Vec(walks, vector_size=walk_params['dimensions'], sg=1, workers=workers, **embedding_params)
 
-    # Save models
-    os.makedirs('app/app/models', exist_ok=True)
-    joblib.dump(rf_clf, 'app/models/rf_model.pkl')
-    joblib.dump(product_embeddings, 'app/models/product_embeddings.pkl')
 
-    print("✅ Training complete. Models saved.")
+def sample_pairs(customer_codes, product_codes, n_products, max_pairs_per_customer, max_positives, seed):
+    """
+    Balanced positive / negative product pairs as code arrays plus labels.
+    Positives are capped per customer and reservoir-sampled overall;
+    negatives are drawn by index.
+    """
+    rng = np.random.default_rng(seed)
+    positives = PairReservoir(max_positives, rng)
+    for first, second in positive_pair_blocks(customer_codes, product_codes, max_pairs_per_customer, rng):
+        positives.add(first, second)
+    positive_first, positive_second = positives.pairs()
+    sampler = NegativeSampler(customer_codes, product_codes, n_products, rng)
+    negative_first, negative_second = sampler.sample(positive_first.size)
+    num_neg_samples = negative_first.size
+    keep = rng.permutation(positive_first.size)[:num_neg_samples]
+    return {
+        'first': np.concatenate([positive_first[keep], negative_first]),
+        'second': np.concatenate([positive_second[keep], negative_second]),
+        'labels': np.r_[np.ones(num_neg_samples, dtype=np.int8), np.zeros(num_neg_samples, dtype=np.int8)]
+    }
+
+
+def train_and_save_models(workers=1, max_pairs_per_customer=1000, max_positives=None, shard_rows=1_000_000,
+                          n_estimators=100, seed=None, cache_dir=cache_directory, refresh=()):
+    """
+    Each stage output is checkpointed in `cache_dir` under a hash of its
+    parameters and upstream stages, so a rerun only recomputes the stages
+    whose inputs changed (or those named in `refresh`, and everything
+    downstream of them). The extract stage
+    always runs: it only reads sales past the co-purchase watermark, and its
+    content hash keys everything downstream.
+    """
+    started = time.perf_counter()
+    cache = StageCache(cache_dir, refresh, STAGE_INPUTS)
+    timings = cache.timings
+
+    with stage('extract', timings):
+        # Only sales newer than the co-purchase state's watermark are read
+        conn = get_db_connection()
+        state, _ = update_copurchase_state(conn)
+        df = state.customer_product_frame()
+        extract_key = frame_digest(df)
+        customer_codes, _ = pd.factorize(df['CustomerID'])
+        product_codes, products = pd.factorize(df['ProductID'])
+        products = products.tolist()
+
+    # Upstream keys are computed up front, so stages behind a checkpoint are never loaded
+    graph_inputs = {'extract': extract_key}
+    walks_inputs = {'graph': cache.key('graph', graph_inputs), 'seed': seed, **walk_params}
+    embeddings_inputs = {'walks': cache.key('walks', walks_inputs), **embedding_params}
+    pairs_inputs = {'extract': extract_key, 'max_pairs_per_customer': max_pairs_per_customer,
+                    'max_positives': max_positives, 'seed': seed}
+
+    def graph():
+        return build_graph(df)
+
+    def walks():
+        return generate_walks(cache.run('graph', graph_inputs, graph)[1], workers, seed)
+
+    def embeddings():
+        return fit_embeddings(cache.run('walks', walks_inputs, walks)[1], workers)
+
+    embeddings_key, model = cache.run('embeddings', embeddings_inputs, embeddings)
+    product_matrix = model.wv[products]
+    product_embeddings = dict(zip(products, product_matrix))
+
+    pairs_key, pairs = cache.run('pairs', pairs_inputs, lambda: sample_pairs(
+        customer_codes, product_codes, len(products), max_pairs_per_customer, max_positives, seed
+    ))
+
+    # Written to memory-mapped shards, so the matrix never has to fit in RAM
+    features_inputs = {'pairs': pairs_key, 'embeddings': embeddings_key, 'shard_rows': shard_rows, 'seed': seed}
+    features_key = cache.key('features', features_inputs)
+    shard_dir = os.path.join(cache_dir, 'shards', features_key)
+
+    def features():
+        return write_feature_shards(
+            shard_dir, product_matrix, pairs['first'], pairs['second'], pairs['labels'],
+            shard_rows=shard_rows, rng=np.random.default_rng(seed)
+        )
+
+    def classifier():
+        # Shards deleted by hand are rewritten rather than trusted from the checkpoint
+        if not os.path.exists(os.path.join(shard_dir, 'manifest.json')):
+            cache.refresh.add('features')
+        cache.run('features', features_inputs, features)
+        rf_clf = fit_forest_on_shards(shard_dir, n_estimators=n_estimators, workers=workers, random_state=seed)
+        # Inference runs in the API workers, which pick their own parallelism
+        rf_clf.n_jobs = None
+        return rf_clf
+
+    _, rf_clf = cache.run('classifier', {'features': features_key, 'n_estimators': n_estimators}, classifier)
+
+    with stage('save', timings):
+        os.makedirs('app/models', exist_ok=True)
+        joblib.dump(rf_clf, 'app/models/rf_model.pkl')
+        save_embeddings(product_embeddings, model, df)
+
+    print(f"✅ Training complete in {time.perf_counter() - started:.2f}s. Models saved.")
+    return timings
+
+
+def save_embeddings(product_embeddings, model, edges):
+    # Each file is swapped in whole, so the API can keep serving while they are replaced
+    atomic_dump(product_embeddings, embeddings_path)
+    save_embedding_matrix(product_embeddings, embeddings_path)
+    atomic_dump({'model': model, 'edges': edges}, embedding_model_path)
+
+
+def update_embeddings(workers=1, seed=None):
+    """
+    Incremental alternative to train_and_save_models for new sales: random
+    walks are generated only from the customers and products of edges the
+    saved Word2Vec model has not seen, the model's vocabulary is extended
+    and training continues on those walks. product_embeddings.pkl (and its
+    .npy matrix) are then replaced, with new products appended after the
+    existing ones. The RandomForest is left as is.
+    """
+    if not os.path.exists(embedding_model_path):
+        raise FileNotFoundError(f"{embedding_model_path} not found; run a full training first")
+    started = time.perf_counter()
+    timings = {}
+
+    with stage('extract', timings):
+        conn = get_db_connection()
+        state, _ = update_copurchase_state(conn)
+        df = state.customer_product_frame()
+
+    with stage('diff', timings):
+        saved = joblib.load(embedding_model_path)
+        model = saved['model']
+        new_edges = df.merge(saved['edges'], how='left', indicator=True)
+        new_edges = new_edges[new_edges['_merge'] == 'left_only']
+        print(f"{len(new_edges)} new customer-product edges")
+    if new_edges.empty:
+        return timings
+
+    with stage('walks', timings):
+        B = build_graph(df)
+        touched = pd.unique(pd.concat([new_edges['CustomerID'], new_edges['ProductID']]))
+        walks = uniform_random_walks(
+            B, touched, walk_params['walk_length'], walk_params['num_walks'], np.random.default_rng(seed)
+        )
+
+    with stage('embedding_fit', timings):
+        model.workers = workers
+        model.build_vocab(walks, update=True)
+        model.train(walks, total_examples=len(walks), epochs=model.epochs)
+
+    with stage('save', timings):
+        products = list(joblib.load(embeddings_path))
+        known = set(products)
+        products += [p for p in df['ProductID'].unique().tolist() if p not in known]
+        save_embeddings(dict(zip(products, model.wv[products])), model, df)
+
+    print(f"✅ Embeddings updated in {time.perf_counter() - started:.2f}s.")
+    return timings
 
 
 if __name__ == '__main__':
-    train_and_save_models()
+    parser = argparse.ArgumentParser(description='Train product embeddings and the pair RandomForest')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Processes for random walks, threads for embedding and forest fitting')
+    parser.add_argument('--max-pairs-per-customer', type=int, default=1000,
+                        help='Positive pairs sampled from any one basket')
+    parser.add_argument('--max-positives', type=int, default=None,
+                        help='Reservoir size for positive pairs overall (default: keep all)')
+    parser.add_argument('--shard-rows', type=int, default=1_000_000,
+                        help='Rows per on-disk feature shard; one share of the trees is fitted per shard')
+    parser.add_argument('--trees', type=int, default=100, help='RandomForest n_estimators')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for walks, pair sampling and the forest')
+    parser.add_argument('--cache-dir', default=cache_directory, help='Directory of the stage checkpoints')
+    parser.add_argument('--refresh', nargs='+', default=(), choices=list(STAGE_INPUTS),
+                        help='Recompute these stages even if a checkpoint exists')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only extend the saved embeddings with new customers / products (no forest retrain)')
+    args = parser.parse_args()
+    if args.incremental:
+        update_embeddings(workers=args.workers, seed=args.seed)
+    else:
+        train_and_save_models(workers=args.workers, max_pairs_per_customer=args.max_pairs_per_customer,
+                              max_positives=args.max_positives, shard_rows=args.shard_rows,
+                              n_estimators=args.trees, seed=args.seed, cache_dir=args.cache_dir,
+                              refresh=args.refresh)
@@ -0,0 +1,231 @@
+import json
+import os
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.ensemble import RandomForestClassifier
+
+from app.pair_sampling import pair_count, pair_features, unrank_pairs
+
+
+def baskets(customer_codes, product_codes):
+    """
+    Distinct products per customer, sorted by customer: (products, starts,
+    sizes) where customer g's basket is products[starts[g]:starts[g] + sizes[g]].
+    """
+    frame = pd.DataFrame({'customer': customer_codes, 'product': product_codes}).drop_duplicates()
+    frame = frame.sort_values('customer', kind='stable')
+    customers = frame['customer'].to_numpy()
+    products = frame['product'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, customers[1:] != customers[:-1]]) if customers.size else np.empty(0, int)
+    sizes = np.diff(np.r_[starts, customers.size])
+    return products, starts, sizes
+
+
+def positive_pair_blocks(customer_codes, product_codes, max_per_customer=None, rng=None):
+    """
+    Stream the positive pairs (two products in the same basket) as blocks of
+    product code arrays, without expanding every basket at once.
+
+    Baskets of the same size are expanded together with one np.triu_indices
+    pattern. Baskets with more than `max_per_customer` pairs contribute a
+    uniform sample of that many of their pairs instead.
+    """
+    rng = rng or np.random.default_rng()
+    products, starts, sizes = baskets(customer_codes, product_codes)
+
+    for size in np.unique(sizes[sizes >= 2]):
+        group_starts = starts[sizes == size]
+        n_pairs = pair_count(int(size))
+        if max_per_customer is None or n_pairs <= max_per_customer:
+            i, j = np.triu_indices(size, 1)
+            yield products[(group_starts[:, None] + i).ravel()], products[(group_starts[:, None] + j).ravel()]
+            continue
+
+        for start in group_starts:
+            i, j = unrank_pairs(rng.choice(n_pairs, max_per_customer, replace=False), int(size))
+            yield products[start + i], products[start + j]
+
+
+def uniform_random_walks(B, start_nodes, walk_length, num_walks, rng=None):
+    """
+    `num_walks` random walks of `walk_length` nodes from each start node of
+    graph B, stepping to a uniformly chosen neighbour: the walks of Node2Vec
+    with p = q = 1, as it is trained here, without precomputing transition
+    probabilities for the whole graph. Nodes come back as strings, like
+    Node2Vec.walks.
+    """
+    rng = rng or np.random.default_rng()
+    nodes = list(B.nodes)
+    position = {node: i for i, node in enumerate(nodes)}
+    adjacency = nx.to_scipy_sparse_array(B, nodelist=nodes, format='csr')
+    indptr, indices = adjacency.indptr, adjacency.indices
+    degree = np.diff(indptr)
+
+    starts = np.array([position[node] for node in start_nodes if node in position], dtype=np.int64)
+    starts = rng.permutation(np.repeat(starts[degree[starts] > 0], num_walks))
+    walks = np.empty((starts.size, walk_length), dtype=np.int64)
+    walks[:, 0] = starts
+    for step in range(1, walk_length):
+        current = walks[:, step - 1]
+        walks[:, step] = indices[indptr[current] + (rng.random(current.size) * degree[current]).astype(np.int64)]
+
+    names = np.array([str(node) for node in nodes], dtype=object)
+    return names[walks].tolist()
+
+
+class PairReservoir:
+    """
+    Uniform sample of at most `capacity` pairs from a stream of pair blocks
+    (reservoir sampling, one vectorised step per block). Keeps everything
+    when `capacity` is None.
+    """
+
+    def __init__(self, capacity=None, rng=None):
+        self.capacity = capacity
+        self.rng = rng or np.random.default_rng()
+        self.seen = 0
+        self._blocks = []
+        self.first = np.empty(0, dtype=np.int64)
+        self.second = np.empty(0, dtype=np.int64)
+
+    def add(self, first, second):
+        first, second = np.asarray(first, dtype=np.int64), np.asarray(second, dtype=np.int64)
+        if self.capacity is None:
+            self._blocks.append((first, second))
+            self.seen += first.size
+            return
+
+        # Fill up first, then item number s replaces a random slot with probability capacity / (s + 1)
+        room = max(0, min(self.capacity - self.first.size, first.size))
+        self.first = np.concatenate([self.first, first[:room]])
+        self.second = np.concatenate([self.second, second[:room]])
+        seen = self.seen + room + np.arange(first.size - room)
+        slots = (self.rng.random(seen.size) * (seen + 1)).astype(np.int64)
+        take = slots < self.capacity
+        # When two items land on the same slot the later one wins, as in the sequential algorithm
+        slots, items = slots[take][::-1], np.flatnonzero(take)[::-1] + room
+        slots, last = np.unique(slots, return_index=True)
+        self.first[slots] = first[items[last]]
+        self.second[slots] = second[items[last]]
+        self.seen += first.size
+
+    def pairs(self):
+        if self.capacity is None and self._blocks:
+            self.first = np.concatenate([self.first] + [f for f, _ in self._blocks])
+            self.second = np.concatenate([self.second] + [s for _, s in self._blocks])
+            self._blocks = []
+        return self.first, self.second
+
+
+class NegativeSampler:
+    """
+    Draw product pairs that no customer bought together, by index: pair ranks
+    are drawn at random, unranked to (i, j) and rejected when any customer's
+    basket holds both products (one sparse row product per batch), so the
+    pair space is never enumerated.
+    """
+
+    def __init__(self, customer_codes, product_codes, n_products, rng=None):
+        self.n_products = n_products
+        self.rng = rng or np.random.default_rng()
+        customer_codes = np.asarray(customer_codes)
+        self.incidence = sparse.csr_matrix(
+            (np.ones(customer_codes.size, dtype=np.int32), (np.asarray(product_codes), customer_codes)),
+            shape=(n_products, int(customer_codes.max()) + 1 if customer_codes.size else 0)
+        )
+        self.incidence.data[:] = 1
+
+    def bought_together(self, first, second, block_size=100000):
+        together = np.empty(first.size, dtype=bool)
+        for start in range(0, first.size, block_size):
+            block = slice(start, start + block_size)
+            shared = self.incidence[first[block]].multiply(self.incidence[second[block]])
+            together[block] = np.asarray(shared.sum(axis=1)).ravel() > 0
+        return together
+
+    def sample(self, n_pairs, max_rounds=20):
+        """
+        Up to `n_pairs` distinct negative pairs as two code arrays, fewer only
+        if the pair space runs out.
+        """
+        total = pair_count(self.n_products)
+        keys = np.empty(0, dtype=np.int64)
+        for _ in range(max_rounds):
+            missing = n_pairs - keys.size
+            if missing <= 0 or total == 0:
+                break
+            ranks = np.unique(self.rng.integers(0, total, size=int(missing * 1.2) + 16))
+            first, second = unrank_pairs(ranks, self.n_products)
+            ranks = ranks[~self.bought_together(first, second)]
+            keys = np.union1d(keys, ranks)
+
+        keys = self.rng.permutation(keys)[:n_pairs]
+        return unrank_pairs(keys, self.n_products)
+
+
+#! ------------------------------
+# Feature matrices as memory-mapped .npy shards
+
+def write_feature_shards(directory, product_matrix, first, second, labels, shard_rows=1_000_000, rng=None):
+    """
+    Write the pair features (concatenated embeddings) and labels in shuffled
+    order to .npy shards of at most `shard_rows` rows, filled one block at a
+    time through memory maps. Returns the manifest, also saved as
+    manifest.json in `directory`.
+    """
+    rng = rng or np.random.default_rng()
+    os.makedirs(directory, exist_ok=True)
+    order = rng.permutation(labels.size)
+    width = 2 * product_matrix.shape[1]
+    block_rows = 65536
+
+    shards = []
+    for number, start in enumerate(range(0, order.size, shard_rows)):
+        rows = order[start:start + shard_rows]
+        X_path = os.path.join(directory, f'X_{number:05d}.npy')
+        y_path = os.path.join(directory, f'y_{number:05d}.npy')
+        X = np.lib.format.open_memmap(X_path, mode='w+', dtype=np.float32, shape=(rows.size, width))
+        for block in range(0, rows.size, block_rows):
+            picked = rows[block:block + block_rows]
+            X[block:block + picked.size] = pair_features(product_matrix, first[picked], second[picked])
+        X.flush()
+        del X
+        np.save(y_path, labels[rows].astype(np.int8))
+        shards.append({'X': os.path.basename(X_path), 'y': os.path.basename(y_path), 'rows': int(rows.size)})
+
+    manifest = {'rows': int(order.size), 'width': width, 'shards': shards}
+    with open(os.path.join(directory, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_feature_shards(directory):
+    """
+    (X, y) memory maps of every shard listed in the directory's manifest.
+    """
+    with open(os.path.join(directory, 'manifest.json')) as f:
+        manifest = json.load(f)
+    return [
+        (np.load(os.path.join(directory, shard['X']), mmap_mode='r'), np.load(os.path.join(directory, shard['y'])))
+        for shard in manifest['shards']
+    ]
+
+
+def fit_forest_on_shards(directory, n_estimators=100, workers=1, random_state=None):
+    """
+    RandomForest over data that need not fit in memory: with several shards,
+    each one grows its share of the trees (warm_start), so only one shard is
+    paged in at a time. With a single shard this is a plain fit.
+    """
+    shards = load_feature_shards(directory)
+    per_shard = -(-n_estimators // max(1, len(shards)))
+    forest = RandomForestClassifier(n_estimators=0, warm_start=True, n_jobs=workers, random_state=random_state)
+    for number, (X, y) in enumerate(shards):
+        forest.n_estimators = min(n_estimators, per_shard * (number + 1))
+        if forest.n_estimators > len(getattr(forest, 'estimators_', [])):
+            forest.fit(X, y)
+    forest.warm_start = False
+    return forest
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import time
+
+import joblib
+import pandas as pd
+
+# Bump to invalidate every checkpoint when a stage's output format changes
+STAGE_FORMAT_VERSION = 1
+
+
+def frame_digest(df):
+    """
+    Content hash of a DataFrame (values and column names, not the index).
+    """
+    digest = hashlib.sha256(json.dumps(list(map(str, df.columns))).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def atomic_dump(value, path):
+    # Written under a temporary name first so an interrupted run never leaves a partial file
+    joblib.dump(value, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+class StageCache:
+    """
+    Checkpoints of the training stages, one joblib file per stage output in
+    `directory`, named after a hash of the stage's parameters and the keys of
+    the stages it reads from. A stage is recomputed only when that key has no
+    checkpoint yet, or when its name is in `refresh`.
+
+    Keys can be computed without running a stage (`key`), so a stage whose
+    downstream checkpoint exists is never loaded at all. `inputs` maps each
+    stage to the stages it reads, so refreshing one also refreshes everything
+    built from it.
+    """
+
+    def __init__(self, directory, refresh=(), inputs=None):
+        self.directory = directory
+        self.refresh = set(refresh)
+        inputs = inputs or {}
+        while True:
+            dependents = {name for name, sources in inputs.items() if self.refresh & set(sources)} - self.refresh
+            if not dependents:
+                break
+            self.refresh |= dependents
+        self.timings = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, name, params):
+        payload = json.dumps({'stage': name, 'version': STAGE_FORMAT_VERSION, **params}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:16]
+
+    def path(self, name, key):
+        return os.path.join(self.directory, f'{name}-{key}.pkl')
+
+    def run(self, name, params, compute):
+        """
+        (key, output) of a stage: loaded from its checkpoint when there is
+        one, otherwise computed by `compute()` and saved.
+        """
+        key = self.key(name, params)
+        path = self.path(name, key)
+        start = time.perf_counter()
+
+        if name not in self.refresh and os.path.exists(path):
+            output = joblib.load(path)
+            self.timings[name] = time.perf_counter() - start
+            print(f"⏱️  {name}: {self.timings[name]:.2f}s (checkpoint {key})")
+            return key, output
+
+        output = compute()
+        atomic_dump(output, path)
+        self.timings[name] = time.perf_counter() - start
+        print(f"⏱️  {name}: {self.timings[name]:.2f}s")
+        return key, output